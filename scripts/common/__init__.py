@@ -0,0 +1,7 @@
+"""
+Helpers shared by the scripts in several directories under scripts/.
+
+Scripts put scripts/ on sys.path and import from here, e.g.:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from common.rate_limiter import RateLimiter
+"""
@@ -0,0 +1,38 @@
+"""
+Client-side request throttling shared by the geopoints and listings scripts.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket, safe to share between threads: up to `burst` calls go out
+    at once, then calls are admitted at `rate` per second. With the default
+    burst=1, calls are simply spaced at least 1/rate seconds apart."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going negative reserves a future token; sleep until it is due
+            self.tokens -= 1
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold every caller back at least `seconds` from now (after throttling)."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens = min(self.tokens, -seconds * self.rate)
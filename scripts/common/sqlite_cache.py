@@ -0,0 +1,40 @@
+"""
+On-disk key/value cache with a maximum age, shared by the listings scripts.
+"""
+
+import json
+import sqlite3
+import time
+
+
+class SQLiteCache:
+    """JSON values in one SQLite table, keyed by string.
+
+    Entries older than max_age seconds are treated as missing; set() replaces
+    them with a fresh timestamp.
+    """
+
+    def __init__(self, path, table, max_age):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.table = table
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, fetched_at REAL, value TEXT)"
+        )
+        self.max_age = max_age
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or too old."""
+        row = self.conn.execute(
+            f"SELECT fetched_at, value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row and time.time() - row[0] < self.max_age:
+            return json.loads(row[1])
+        return None
+
+    def set(self, key, value):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, fetched_at, value) VALUES (?, ?, ?)",
+            (key, time.time(), json.dumps(value)),
+        )
+        self.conn.commit()
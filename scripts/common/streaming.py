@@ -0,0 +1,43 @@
+"""
+Streaming row-by-row enrichment, shared by the geopoints scripts.
+
+Rows are read, handed to a thread pool, and written back in input order as
+soon as the head of the queue is done, so a CSV is never fully in memory and
+the output can be swapped in only once it is complete.
+"""
+
+import os
+from collections import deque
+from contextlib import contextmanager
+
+
+def stream_in_order(items, submit, write, window, flush=None):
+    """Call write(item, future) for each item in input order.
+
+    submit(item) starts the item's work and returns a Future, or None if the
+    item needs none. At most `window` items wait at once: beyond that, write
+    blocks on the oldest. flush, if given, is called before blocking and at the
+    end, e.g. to send a partly filled batch the oldest item may be waiting on.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, submit(item)))
+        if len(pending) > window and flush:
+            flush()
+        while pending and (len(pending) > window or pending[0][1] is None or pending[0][1].done()):
+            write(*pending.popleft())
+
+    if flush:
+        flush()
+    while pending:
+        write(*pending.popleft())
+
+
+@contextmanager
+def replace_on_success(path):
+    """Open path + ".tmp" for writing and move it over path once the block
+    completes; an interrupted run leaves the old file intact."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        yield f
+    os.replace(tmp_path, path)
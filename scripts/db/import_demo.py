@@ -18,7 +18,9 @@ from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+
+from supabase_client import create_pooled_client
 
 # Load .env from repo root
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -30,12 +32,15 @@ SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
 
 DEMO_DIR = PROJECT_ROOT / 'data' / 'listings' / 'demo'
 
+# Listings per upsert request
+UPSERT_BATCH_SIZE = 500
+
 
 def get_supabase_client() -> Client:
     """Create Supabase client from environment variables."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY environment variables.")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return create_pooled_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 def clear_all_data(supabase: Client):
@@ -66,6 +71,28 @@ def clear_all_data(supabase: Client):
                 print(f"  Warning clearing {table}: {e}")
 
 
+def drop_import_indexes(supabase: Client) -> bool:
+    """
+    Drop secondary listing indexes before a fresh bulk load.
+    
+    Requires migrations/007_import_index_functions.sql. Returns True if the
+    indexes were dropped (and so need recreate_import_indexes afterwards).
+    """
+    try:
+        supabase.rpc('drop_import_indexes').execute()
+        print("  Dropped secondary indexes for bulk load")
+        return True
+    except Exception as e:
+        print(f"  Warning: could not drop indexes, importing with them in place: {e}")
+        return False
+
+
+def recreate_import_indexes(supabase: Client):
+    """Recreate the indexes dropped by drop_import_indexes."""
+    print("\nRecreating secondary indexes...")
+    supabase.rpc('recreate_import_indexes').execute()
+
+
 def parse_price(price_str: str) -> Optional[float]:
     if not price_str:
         return None
@@ -104,53 +131,102 @@ def parse_date(date_str: str) -> Optional[str]:
         return None
 
 
-def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
-    """Import a single demo CSV file."""
+def build_listing_data(row: dict, status: str) -> dict:
+    """Build the listings payload for a demo CSV row."""
+    listing_data = {
+        'source_url': row.get('redfin_url', '').strip(),
+        'address': row.get('address', '').strip(),
+        'city': row.get('city', '').strip(),
+        'state': row.get('state', 'CA').strip(),
+        'zip': row.get('zipcode', row.get('zip', '')).strip(),
+        'status': status,
+        'source_platform': 'redfin',
+    }
+    
+    # Only add parsed fields that have a value (no second pass to prune Nones)
+    for key, value in (
+        ('price', parse_price(row.get('price', ''))),
+        ('beds', parse_int(row.get('beds', ''))),
+        ('baths', parse_float(row.get('baths', ''))),
+        ('sqft', parse_int(row.get('sqft', ''))),
+        ('lot_size', row.get('lot_size', '').strip() or None),
+        ('year_built', parse_int(row.get('year_built', ''))),
+        ('property_type', row.get('property_type', '').strip() or None),
+        ('stories', parse_int(row.get('stories', ''))),
+        ('garage_spaces', parse_int(row.get('garage_spaces', ''))),
+        ('price_per_sqft', parse_float(row.get('price_per_sqft', ''))),
+        ('hoa_dues', parse_float(row.get('hoa_dues', ''))),
+        ('listing_date', parse_date(row.get('listing_date', ''))),
+        ('mls_number', row.get('mls_number', '').strip() or None),
+        ('days_on_market', parse_int(row.get('days_on_market', ''))),
+        ('description', (row.get('description', '') or '')[:500] or None),
+    ):
+        if value is not None:
+            listing_data[key] = value
+    return listing_data
+
+
+def load_demo_rows(files: dict) -> dict:
+    """
+    Read all demo CSVs and dedupe by source URL.
+    
+    The same property can appear in more than one file (e.g. active and
+    pending); files are read in order and later statuses win, matching the
+    previous behaviour of upserting each file in turn. Returns
+    {source_url: (status, row)}.
+    """
+    rows_by_url = {}
+    total = 0
+    for status, csv_path in files.items():
+        with open(csv_path) as f:
+            for row in csv.DictReader(f):
+                total += 1
+                source_url = row.get('redfin_url', '').strip()
+                if source_url:
+                    rows_by_url[source_url] = (status, row)
+    
+    print(f"  {total} rows, {len(rows_by_url)} unique listings")
+    return rows_by_url
+
+
+def upsert_demo_listings(supabase: Client, rows_by_url: dict,
+                         batch_size: int = UPSERT_BATCH_SIZE) -> dict:
+    """Upsert all deduped listings in batches. Returns {source_url: id}.
+    
+    PostgREST bulk upserts need every object in a request to have the same
+    keys, and a key sent as null overwrites the existing column. So
+    listings are grouped by key set rather than padded with None, which
+    leaves columns a row doesn't have untouched, as the per-row upsert did.
+    """
+    by_columns = {}
+    for status, row in rows_by_url.values():
+        listing = build_listing_data(row, status)
+        by_columns.setdefault(frozenset(listing), []).append(listing)
+    
+    listing_ids = {}
+    for group in by_columns.values():
+        for i in range(0, len(group), batch_size):
+            result = supabase.table('listings').upsert(
+                group[i:i + batch_size], on_conflict='source_url'
+            ).execute()
+            listing_ids.update((r['source_url'], r['id']) for r in result.data or [])
+    return listing_ids
+
+
+def import_demo_rows(supabase: Client, rows_by_url: dict) -> dict:
+    """Import deduped demo listings, then their brokers and links."""
     stats = {'listings': 0, 'brokers': 0, 'emails': 0, 'links': 0}
     
-    with open(csv_path) as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    listing_ids = upsert_demo_listings(supabase, rows_by_url)
     
-    print(f"  Importing {len(rows)} {status} listings...")
+    # Bind table builders once; each .select()/.insert()/... starts a fresh query
+    brokers_tbl = supabase.table('brokers')
+    broker_listings_tbl = supabase.table('broker_listings')
     
-    for i, row in enumerate(rows, 1):
-        # Insert listing
-        listing_data = {
-            'source_url': row.get('redfin_url', '').strip(),
-            'address': row.get('address', '').strip(),
-            'city': row.get('city', '').strip(),
-            'state': row.get('state', 'CA').strip(),
-            'zip': row.get('zipcode', row.get('zip', '')).strip(),
-            'price': parse_price(row.get('price', '')),
-            'beds': parse_int(row.get('beds', '')),
-            'baths': parse_float(row.get('baths', '')),
-            'sqft': parse_int(row.get('sqft', '')),
-            'lot_size': row.get('lot_size', '').strip() or None,
-            'year_built': parse_int(row.get('year_built', '')),
-            'property_type': row.get('property_type', '').strip() or None,
-            'stories': parse_int(row.get('stories', '')),
-            'garage_spaces': parse_int(row.get('garage_spaces', '')),
-            'price_per_sqft': parse_float(row.get('price_per_sqft', '')),
-            'hoa_dues': parse_float(row.get('hoa_dues', '')),
-            'status': status,
-            'listing_date': parse_date(row.get('listing_date', '')),
-            'mls_number': row.get('mls_number', '').strip() or None,
-            'days_on_market': parse_int(row.get('days_on_market', '')),
-            'description': (row.get('description', '') or '')[:500] or None,
-            'source_platform': 'redfin',
-        }
-        
-        listing_data = {k: v for k, v in listing_data.items() if v is not None}
-        
-        # Upsert to handle duplicates (same property in active + pending)
-        result = supabase.table('listings').upsert(
-            listing_data, on_conflict='source_url'
-        ).execute()
-        if not result.data:
+    for source_url, (status, row) in rows_by_url.items():
+        listing_id = listing_ids.get(source_url)
+        if not listing_id:
             continue
-        
-        listing_id = result.data[0]['id']
         stats['listings'] += 1
         
         # Insert broker
@@ -159,7 +235,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
         
         if license_number:
             # Check if broker exists
-            existing = supabase.table('brokers').select('id').eq('license_number', license_number).execute()
+            existing = brokers_tbl.select('id').eq('license_number', license_number).execute()
             
             if existing.data:
                 broker_id = existing.data[0]['id']
@@ -174,7 +250,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                 if row.get('brokerage', '').strip():
                     update_data['brokerage_name'] = row.get('brokerage', '').strip()
                 if update_data:
-                    supabase.table('brokers').update(update_data).eq('id', broker_id).execute()
+                    brokers_tbl.update(update_data).eq('id', broker_id).execute()
             else:
                 # Insert new broker
                 broker_data = {
@@ -187,7 +263,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                 }
                 broker_data = {k: v for k, v in broker_data.items() if v is not None}
                 
-                result = supabase.table('brokers').insert(broker_data).execute()
+                result = brokers_tbl.insert(broker_data).execute()
                 if result.data:
                     broker_id = result.data[0]['id']
                     stats['brokers'] += 1
@@ -198,12 +274,12 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                 
             if broker_id:
                 # Link broker to listing (listing agent is always seller role)
-                existing_link = supabase.table('broker_listings').select('id').eq(
+                existing_link = broker_listings_tbl.select('id').eq(
                     'broker_id', broker_id
                 ).eq('listing_id', listing_id).eq('role', 'seller').execute()
                 
                 if not existing_link.data:
-                    supabase.table('broker_listings').insert({
+                    broker_listings_tbl.insert({
                         'broker_id': broker_id,
                         'listing_id': listing_id,
                         'role': 'seller',
@@ -217,7 +293,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
             
             if buyer_license:
                 # Check if buyer broker exists
-                existing = supabase.table('brokers').select('id').eq('license_number', buyer_license).execute()
+                existing = brokers_tbl.select('id').eq('license_number', buyer_license).execute()
                 
                 if existing.data:
                     buyer_broker_id = existing.data[0]['id']
@@ -228,7 +304,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                     if row.get('buyer_agent', '').strip():
                         update_data['name'] = row.get('buyer_agent', '').strip()
                     if update_data:
-                        supabase.table('brokers').update(update_data).eq('id', buyer_broker_id).execute()
+                        brokers_tbl.update(update_data).eq('id', buyer_broker_id).execute()
                 else:
                     # Insert new buyer broker
                     buyer_data = {
@@ -241,7 +317,7 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                     }
                     buyer_data = {k: v for k, v in buyer_data.items() if v is not None}
                     
-                    result = supabase.table('brokers').insert(buyer_data).execute()
+                    result = brokers_tbl.insert(buyer_data).execute()
                     if result.data:
                         buyer_broker_id = result.data[0]['id']
                         stats['brokers'] += 1
@@ -252,12 +328,12 @@ def import_demo_file(supabase: Client, csv_path: Path, status: str) -> dict:
                 
                 if buyer_broker_id:
                     # Check if link exists
-                    existing_link = supabase.table('broker_listings').select('id').eq(
+                    existing_link = broker_listings_tbl.select('id').eq(
                         'broker_id', buyer_broker_id
                     ).eq('listing_id', listing_id).eq('role', 'buyer').execute()
                     
                     if not existing_link.data:
-                        supabase.table('broker_listings').insert({
+                        broker_listings_tbl.insert({
                             'broker_id': buyer_broker_id,
                             'listing_id': listing_id,
                             'role': 'buyer',
@@ -300,19 +376,20 @@ def main():
     supabase = get_supabase_client()
     print(f"\nConnected to Supabase: {SUPABASE_URL}")
     
-    # Clear existing data
+    # Clear existing data; a fresh load is cheaper without secondary indexes
+    indexes_dropped = False
     if not args.no_clear:
         clear_all_data(supabase)
+        indexes_dropped = drop_import_indexes(supabase)
     
     # Import demo files
     print("\nImporting demo data...")
-    total_stats = {'listings': 0, 'brokers': 0, 'emails': 0, 'links': 0}
-    
-    for status, path in existing_files.items():
-        stats = import_demo_file(supabase, path, status)
-        print(f"    {status}: {stats['listings']} listings, {stats['brokers']} brokers, {stats['emails']} emails")
-        for k in total_stats:
-            total_stats[k] += stats[k]
+    try:
+        rows_by_url = load_demo_rows(existing_files)
+        total_stats = import_demo_rows(supabase, rows_by_url)
+    finally:
+        if indexes_dropped:
+            recreate_import_indexes(supabase)
     
     print(f"\n=== IMPORT COMPLETE ===")
     print(f"Total listings: {total_stats['listings']}")
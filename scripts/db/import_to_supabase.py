@@ -15,6 +15,8 @@ Usage:
 Environment variables:
     SUPABASE_URL - Your Supabase project URL
     SUPABASE_KEY - Your Supabase anon/service key
+
+Requires the import_listing_row SQL function (migrations/006_import_listing_row.sql).
 """
 
 import argparse
@@ -26,7 +28,9 @@ from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+
+from supabase_client import create_pooled_client
 
 # Load .env from repo root
 env_path = Path(__file__).parent.parent.parent / '.env'
@@ -45,7 +49,7 @@ def get_supabase_client() -> Client:
             "  export SUPABASE_URL=https://xxx.supabase.co\n"
             "  export SUPABASE_KEY=your-anon-key"
         )
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return create_pooled_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 def parse_price(price_str: str) -> Optional[float]:
@@ -101,8 +105,8 @@ def normalize_status(status: str) -> str:
         return 'active'
 
 
-def upsert_listing(supabase: Client, row: dict, is_sold: bool = False) -> Optional[str]:
-    """Upsert a listing and return its ID."""
+def build_listing_data(row: dict, is_sold: bool = False) -> Optional[dict]:
+    """Build the listings payload for a CSV row (None if it has no URL)."""
     source_url = row.get('redfin_url', '').strip()
     if not source_url:
         return None
@@ -115,294 +119,165 @@ def upsert_listing(supabase: Client, row: dict, is_sold: bool = False) -> Option
         'city': row.get('city', '').strip(),
         'state': row.get('state', 'CA').strip(),
         'zip': row.get('zipcode', row.get('zip', '')).strip(),
-        'price': parse_price(row.get('price', '')),
-        'beds': parse_int(row.get('beds', '')),
-        'baths': parse_float(row.get('baths', '')),
-        'sqft': parse_int(row.get('sqft', '')),
-        'lot_size': row.get('lot_size', '').strip() or None,
-        'year_built': parse_int(row.get('year_built', '')),
-        'property_type': row.get('property_type', '').strip() or None,
-        'stories': parse_int(row.get('stories', '')),
-        'garage_spaces': parse_int(row.get('garage_spaces', '')),
-        'price_per_sqft': parse_float(row.get('price_per_sqft', '')),
-        'hoa_dues': parse_float(row.get('hoa_dues', '')),
         'status': status,
-        'listing_date': parse_date(row.get('listing_date', '')),
-        'mls_number': row.get('mls_number', '').strip() or None,
-        'days_on_market': parse_int(row.get('days_on_market', '')),
         'description': (row.get('description', '') or '')[:500],
         'source_platform': 'redfin',
-        'scraped_at': row.get('scraped_at', '').strip() or None,
     }
+    
+    # Only add parsed fields that have a value (no second pass to prune Nones)
+    for key, value in (
+        ('price', parse_price(row.get('price', ''))),
+        ('beds', parse_int(row.get('beds', ''))),
+        ('baths', parse_float(row.get('baths', ''))),
+        ('sqft', parse_int(row.get('sqft', ''))),
+        ('lot_size', row.get('lot_size', '').strip() or None),
+        ('year_built', parse_int(row.get('year_built', ''))),
+        ('property_type', row.get('property_type', '').strip() or None),
+        ('stories', parse_int(row.get('stories', ''))),
+        ('garage_spaces', parse_int(row.get('garage_spaces', ''))),
+        ('price_per_sqft', parse_float(row.get('price_per_sqft', ''))),
+        ('hoa_dues', parse_float(row.get('hoa_dues', ''))),
+        ('listing_date', parse_date(row.get('listing_date', ''))),
+        ('mls_number', row.get('mls_number', '').strip() or None),
+        ('days_on_market', parse_int(row.get('days_on_market', ''))),
+        ('scraped_at', row.get('scraped_at', '').strip() or None),
+    ):
+        if value is not None:
+            listing_data[key] = value
+    
     scrape_instance_id = (row.get('scrape_instance_id') or '').strip()
     if scrape_instance_id:
         listing_data['scrape_instance_id'] = scrape_instance_id
     
-    listing_data = {k: v for k, v in listing_data.items() if v is not None}
-    
-    result = supabase.table('listings').upsert(
-        listing_data,
-        on_conflict='source_url'
-    ).execute()
-    
-    if result.data:
-        return result.data[0]['id']
-    return None
-
-
-# Cache for DRE lookups to avoid repeated queries
-DRE_CACHE = {}
-
-
-def lookup_dre_license(supabase: Client, license_number: str) -> Optional[dict]:
-    """Look up a license in the DRE database. Returns canonical info."""
-    if not license_number:
-        return None
-    
-    license_number = license_number.strip()
-    
-    if license_number in DRE_CACHE:
-        return DRE_CACHE[license_number]
-    
-    result = supabase.table('dre_licenses').select(
-        'id, license_number, first_name, last_name, name_suffix, full_name, license_type, license_status'
-    ).eq('license_number', license_number).execute()
-    
-    if result.data:
-        DRE_CACHE[license_number] = result.data[0]
-        return result.data[0]
-    
-    DRE_CACHE[license_number] = None
-    return None
+    return listing_data
 
 
-def upsert_broker(supabase: Client, name: str, phone: str, 
-                  license_number: str, brokerage: str) -> Optional[str]:
-    """
-    Upsert a broker by DRE license and return their ID.
-    
-    One broker per DRE license. Uses DRE database for canonical name.
-    Emails are stored separately in broker_emails table.
-    """
+def build_agent(license_number: str, name: str, phone: str, brokerage: str,
+                email: str, role: str) -> Optional[dict]:
+    """Build one agent entry for the import_listing_row payload."""
     license_number = (license_number or '').strip()
-    scraped_name = (name or '').strip()
-    
     if not license_number:
         return None
-    
-    # Look up canonical info from DRE database
-    dre_info = lookup_dre_license(supabase, license_number)
-    
-    # Determine canonical name: prefer DRE, fall back to scraped
-    if dre_info and dre_info.get('full_name'):
-        canonical_name = dre_info['full_name']
-        name_from_dre = True
-    else:
-        canonical_name = scraped_name or None
-        name_from_dre = False
-    
-    # Check if broker exists
-    result = supabase.table('brokers').select('id').eq('license_number', license_number).execute()
-    
-    if result.data:
-        broker_id = result.data[0]['id']
-        
-        # Update with any new info
-        update_data = {}
-        if name_from_dre and canonical_name:
-            update_data['name'] = canonical_name
-            update_data['name_from_dre'] = True
-        if dre_info:
-            update_data['dre_license_id'] = dre_info['id']
-            update_data['dre_verified'] = True
-        if phone:
-            update_data['phone'] = phone.strip()
-        if brokerage:
-            update_data['brokerage_name'] = brokerage.strip()
-        
-        if update_data:
-            supabase.table('brokers').update(update_data).eq('id', broker_id).execute()
-        
-        return broker_id
-    else:
-        # Insert new broker
-        broker_data = {
-            'license_number': license_number,
-            'name': canonical_name,
-            'phone': (phone or '').strip() or None,
-            'brokerage_name': (brokerage or '').strip() or None,
-            'state_licensed': 'CA',
-            'dre_verified': dre_info is not None,
-            'name_from_dre': name_from_dre,
-        }
-        
-        if dre_info:
-            broker_data['dre_license_id'] = dre_info['id']
-        
-        broker_data = {k: v for k, v in broker_data.items() if v is not None}
-        
-        result = supabase.table('brokers').insert(broker_data).execute()
-        if result.data:
-            return result.data[0]['id']
-    
-    return None
+    return {
+        'license_number': license_number,
+        'name': (name or '').strip(),
+        'phone': (phone or '').strip(),
+        'brokerage': (brokerage or '').strip(),
+        'email': (email or '').strip().lower(),
+        'role': role,
+    }
 
 
-def add_broker_email(supabase: Client, broker_id: str, email: str, 
-                     listing_id: Optional[str] = None) -> bool:
-    """
-    Add an email for a broker in the broker_emails junction table.
-    
-    Returns True if email was added/updated, False if skipped.
+def import_listing_row(supabase: Client, listing_data: dict, agents: list,
+                       seen_at: str) -> Optional[dict]:
     """
-    if not broker_id or not email:
-        return False
+    Import one listing with its agents via the import_listing_row SQL function.
     
-    email = email.strip().lower()
-    if not email:
-        return False
+    The listing upsert, DRE name lookup, broker upsert, broker_emails upsert
+    and broker_listings link all happen server-side in one round-trip
+    (see migrations/006_import_listing_row.sql).
     
-    try:
-        # Upsert: create new or update last_seen_at if exists
-        supabase.table('broker_emails').upsert({
-            'broker_id': broker_id,
-            'email': email,
-            'source_listing_id': listing_id,
-            'last_seen_at': datetime.utcnow().isoformat(),
-        }, on_conflict='broker_id,email').execute()
-        return True
-    except Exception as e:
-        if 'duplicate' not in str(e).lower():
-            print(f"  Warning: Could not add broker email: {e}")
-        return False
-
-
-def link_broker_listing(supabase: Client, broker_id: str, listing_id: str, role: str):
-    """Create broker-listing relationship."""
-    if not broker_id or not listing_id:
+    Returns {'listing_id', 'brokers', 'emails', 'links'} or None if skipped.
+    """
+    result = supabase.rpc('import_listing_row', {
+        'p': {
+            'listing': listing_data,
+            'agents': [a for a in agents if a],
+            'seen_at': seen_at,
+        },
+    }).execute()
+    return result.data or None
+
+
+def add_row_stats(stats: dict, imported: Optional[dict]):
+    """Accumulate import_listing_row counts into stats."""
+    if not imported:
+        stats['skipped'] += 1
         return
-    
-    try:
-        supabase.table('broker_listings').upsert({
-            'broker_id': broker_id,
-            'listing_id': listing_id,
-            'role': role,
-        }, on_conflict='broker_id,listing_id,role').execute()
-    except Exception as e:
-        if 'duplicate' not in str(e).lower():
-            print(f"  Warning: Could not link broker to listing: {e}")
+    stats['listings'] += 1
+    stats['brokers'] += imported.get('brokers', 0)
+    stats['emails'] += imported.get('emails', 0)
+    stats['links'] += imported.get('links', 0)
 
 
 def import_active_listings(supabase: Client, csv_path: str) -> dict:
     """Import active/pending listings CSV."""
     stats = {'listings': 0, 'brokers': 0, 'emails': 0, 'links': 0, 'skipped': 0}
+    seen_at = datetime.utcnow().isoformat()
     
-    with open(csv_path) as f:
-        total_rows = sum(1 for _ in f) - 1
-    
+    i = 0
     with open(csv_path) as f:
         reader = csv.DictReader(f)
         for i, row in enumerate(reader, 1):
             address = row.get('address', 'unknown')
             
             if i % 50 == 0 or i == 1:
-                print(f"  [{i}/{total_rows}] Processing: {address[:50]}...")
+                print(f"  [{i}] Processing: {address[:50]}...")
             
-            listing_id = upsert_listing(supabase, row, is_sold=False)
-            if not listing_id:
+            listing_data = build_listing_data(row, is_sold=False)
+            if not listing_data:
                 stats['skipped'] += 1
                 continue
-            stats['listings'] += 1
             
-            # Get agent info
-            license_number = row.get('agent_dre', '').strip()
-            agent_email = row.get('agent_email', '') or row.get('inferred_email', '')
+            seller = build_agent(
+                row.get('agent_dre', ''),
+                name=row.get('listing_agent', ''),
+                phone=row.get('agent_phone', ''),
+                brokerage=row.get('brokerage', ''),
+                email=row.get('agent_email', '') or row.get('inferred_email', ''),
+                role='seller',
+            )
             
-            if license_number:
-                broker_id = upsert_broker(
-                    supabase,
-                    name=row.get('listing_agent', ''),
-                    phone=row.get('agent_phone', ''),
-                    license_number=license_number,
-                    brokerage=row.get('brokerage', ''),
-                )
-                
-                if broker_id:
-                    stats['brokers'] += 1
-                    
-                    # Add email if present
-                    if agent_email and add_broker_email(supabase, broker_id, agent_email, listing_id):
-                        stats['emails'] += 1
-                    
-                    link_broker_listing(supabase, broker_id, listing_id, 'seller')
-                    stats['links'] += 1
+            imported = import_listing_row(supabase, listing_data, [seller], seen_at)
+            add_row_stats(stats, imported)
     
-    print(f"  [{total_rows}/{total_rows}] Done!")
+    print(f"  [{i} rows processed] Done!")
     return stats
 
 
 def import_sold_listings(supabase: Client, csv_path: str) -> dict:
     """Import recently sold listings CSV (has both listing + buyer agents)."""
     stats = {'listings': 0, 'brokers': 0, 'emails': 0, 'links': 0, 'skipped': 0}
+    seen_at = datetime.utcnow().isoformat()
     
-    with open(csv_path) as f:
-        total_rows = sum(1 for _ in f) - 1
-    
+    i = 0
     with open(csv_path) as f:
         reader = csv.DictReader(f)
         for i, row in enumerate(reader, 1):
             address = row.get('address', 'unknown')
             
             if i % 25 == 0 or i == 1:
-                print(f"  [{i}/{total_rows}] Processing: {address[:50]}...")
+                print(f"  [{i}] Processing: {address[:50]}...")
             
-            listing_id = upsert_listing(supabase, row, is_sold=True)
-            if not listing_id:
+            listing_data = build_listing_data(row, is_sold=True)
+            if not listing_data:
                 stats['skipped'] += 1
                 continue
-            stats['listings'] += 1
             
             # Listing agent (seller's rep)
-            seller_license = row.get('agent_dre', '').strip()
-            if seller_license:
-                broker_id = upsert_broker(
-                    supabase,
-                    name=row.get('listing_agent', ''),
-                    phone=row.get('agent_phone', ''),
-                    license_number=seller_license,
-                    brokerage=row.get('brokerage', ''),
-                )
-                if broker_id:
-                    stats['brokers'] += 1
-                    
-                    seller_email = row.get('agent_email', '').strip()
-                    if seller_email and add_broker_email(supabase, broker_id, seller_email, listing_id):
-                        stats['emails'] += 1
-                    
-                    link_broker_listing(supabase, broker_id, listing_id, 'seller')
-                    stats['links'] += 1
+            seller = build_agent(
+                row.get('agent_dre', ''),
+                name=row.get('listing_agent', ''),
+                phone=row.get('agent_phone', ''),
+                brokerage=row.get('brokerage', ''),
+                email=row.get('agent_email', ''),
+                role='seller',
+            )
             
             # Buyer's agent
-            buyer_license = row.get('buyer_agent_dre', '').strip()
-            if buyer_license:
-                buyer_broker_id = upsert_broker(
-                    supabase,
-                    name=row.get('buyer_agent', ''),
-                    phone=row.get('buyer_agent_phone', ''),
-                    license_number=buyer_license,
-                    brokerage=row.get('buyer_brokerage', ''),
-                )
-                if buyer_broker_id:
-                    stats['brokers'] += 1
-                    
-                    buyer_email = row.get('buyer_agent_email', '').strip()
-                    if buyer_email and add_broker_email(supabase, buyer_broker_id, buyer_email, listing_id):
-                        stats['emails'] += 1
-                    
-                    link_broker_listing(supabase, buyer_broker_id, listing_id, 'buyer')
-                    stats['links'] += 1
+            buyer = build_agent(
+                row.get('buyer_agent_dre', ''),
+                name=row.get('buyer_agent', ''),
+                phone=row.get('buyer_agent_phone', ''),
+                brokerage=row.get('buyer_brokerage', ''),
+                email=row.get('buyer_agent_email', ''),
+                role='buyer',
+            )
+            
+            imported = import_listing_row(supabase, listing_data, [seller, buyer], seen_at)
+            add_row_stats(stats, imported)
     
-    print(f"  [{total_rows}/{total_rows}] Done!")
+    print(f"  [{i} rows processed] Done!")
     return stats
 
 
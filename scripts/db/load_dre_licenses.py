@@ -3,20 +3,26 @@
 Load CA DRE license database into Supabase.
 
 Usage:
-    python load_dre_licenses.py [--file PATH]
+    python load_dre_licenses.py [--file PATH] [--batch-size N] [--priority-only] [--gzip] [--low-memory]
 
 Default file: data/ca-dre/CurrList.csv
 """
 
 import argparse
 import csv
+import json
 import os
+import sqlite3
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+
+from supabase_client import create_pooled_client
 
 # Load .env from repo root
 env_path = Path(__file__).parent.parent.parent / '.env'
@@ -27,61 +33,188 @@ SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
 
 DEFAULT_DRE_FILE = Path(__file__).parent.parent.parent / 'data' / 'ca-dre' / 'CurrList.csv'
 
-# Batch size for inserts
-BATCH_SIZE = 500
+# Batch size for upserts. DRE rows are small, so PostgREST takes thousands
+# per request comfortably.
+BATCH_SIZE = 5000
+
+# Read buffer for the DRE CSV; CurrList.csv is large and read front to back
+READ_BUFFER_SIZE = 1 << 20
+
+# Concurrent upsert requests. Records are deduped by license_number first,
+# so batches never conflict with each other.
+MAX_WORKERS = 8
 
 
-def get_supabase_client() -> Client:
+def get_supabase_client(gzip_requests: bool = False) -> Client:
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return create_pooled_client(SUPABASE_URL, SUPABASE_KEY, gzip_requests=gzip_requests)
 
 
 def parse_date(date_str: str) -> Optional[str]:
-    """Parse date like '20250522' to '2025-05-22'."""
-    if not date_str or len(date_str) != 8:
+    """Parse date like '20250522' to '2025-05-22'.
+    
+    Plain slicing instead of a strptime/strftime round-trip. Month and day
+    are range-checked, and only days 29-31 go through datetime to reject
+    dates like Feb 30 that Postgres would refuse.
+    """
+    date_str = date_str.strip()
+    if len(date_str) != 8 or not date_str.isdigit():
         return None
-    try:
-        dt = datetime.strptime(date_str, '%Y%m%d')
-        return dt.strftime('%Y-%m-%d')
-    except ValueError:
+    month, day = date_str[4:6], date_str[6:8]
+    if date_str[:4] == '0000' or not ('01' <= month <= '12' and '01' <= day <= '31'):
         return None
+    if day > '28':
+        try:
+            datetime(int(date_str[:4]), int(month), int(day))
+        except ValueError:
+            return None
+    return f"{date_str[:4]}-{month}-{day}"
 
 
-def transform_row(row: dict) -> dict:
-    """Transform CSV row to database record."""
-    return {
-        'license_number': row.get('lic_number', '').strip(),
-        'last_name': row.get('lastname_primary', '').strip() or None,
-        'first_name': row.get('firstname_secondary', '').strip() or None,
-        'name_suffix': row.get('name_suffix', '').strip() or None,
-        'license_type': row.get('lic_type', '').strip() or None,
-        'license_status': row.get('lic_status', '').strip() or None,
-        'license_effective_date': parse_date(row.get('lic_effective_date', '')),
-        'license_expiration_date': parse_date(row.get('lic_expiration_date', '')),
-        'original_license_date': parse_date(row.get('original_date_of_license', '')),
-        'related_license_number': row.get('related_lic_number', '').strip() or None,
-        'related_name': ' '.join(filter(None, [
-            row.get('related_firstname_secondary', '').strip(),
-            row.get('related_lastname_primary', '').strip(),
-            row.get('related_name_suffix', '').strip()
-        ])) or None,
-        'related_license_type': row.get('related_lic_type', '').strip() or None,
-        'address_1': row.get('address_1', '').strip() or None,
-        'address_2': row.get('address_2', '').strip() or None,
-        'city': row.get('city', '').strip() or None,
-        'state': row.get('state', '').strip() or None,
-        'zip_code': row.get('zip_code', '').strip() or None,
-        'county_name': row.get('county_name', '').strip() or None,
-    }
+# dre_licenses column -> CurrList.csv column, for plain text fields
+TEXT_FIELDS = (
+    ('last_name', 'lastname_primary'),
+    ('first_name', 'firstname_secondary'),
+    ('name_suffix', 'name_suffix'),
+    ('license_type', 'lic_type'),
+    ('license_status', 'lic_status'),
+    ('related_license_number', 'related_lic_number'),
+    ('related_license_type', 'related_lic_type'),
+    ('address_1', 'address_1'),
+    ('address_2', 'address_2'),
+    ('city', 'city'),
+    ('state', 'state'),
+    ('zip_code', 'zip_code'),
+    ('county_name', 'county_name'),
+)
+
+# dre_licenses column -> CurrList.csv column, for YYYYMMDD dates
+DATE_FIELDS = (
+    ('license_effective_date', 'lic_effective_date'),
+    ('license_expiration_date', 'lic_expiration_date'),
+    ('original_license_date', 'original_date_of_license'),
+)
+
+RELATED_NAME_FIELDS = ('related_firstname_secondary', 'related_lastname_primary', 'related_name_suffix')
+
+
+CSV_COLUMNS = (
+    ('lic_number',)
+    + tuple(src for _, src in TEXT_FIELDS)
+    + tuple(src for _, src in DATE_FIELDS)
+    + RELATED_NAME_FIELDS
+)
+
+
+def column_positions(header: list) -> dict:
+    """Map the CSV columns transform_row reads to their csv.reader positions."""
+    index = {name: i for i, name in enumerate(header)}
+    missing = [name for name in CSV_COLUMNS if name not in index]
+    if missing:
+        raise ValueError(f"DRE CSV is missing columns: {', '.join(missing)}")
+    return {name: index[name] for name in CSV_COLUMNS}
+
+
+def transform_row(row: list, pos: dict) -> dict:
+    """Transform CSV row (a csv.reader list, see column_positions) to database record."""
+    record = {col: row[pos[src]].strip() or None for col, src in TEXT_FIELDS}
+    record['license_number'] = row[pos['lic_number']].strip()
+    for col, src in DATE_FIELDS:
+        record[col] = parse_date(row[pos[src]])
+    record['related_name'] = ' '.join(filter(None, [
+        row[pos[src]].strip() for src in RELATED_NAME_FIELDS
+    ])) or None
+    return record
+
+
+class PendingRecords:
+    """Best CSV row seen so far for each license, held in memory.
+
+    A priority-1 (Broker) row can never be beaten, so offer() reports it as
+    final straight away and only remembers the license; lower-priority rows
+    wait here until the end of the file.
+    """
+
+    def __init__(self):
+        self.emitted = set()  # licenses already final with a priority-1 row
+        self.best = {}  # license_number -> (priority, not licensed, raw CSV row)
+
+    def offer(self, lic_num: str, priority: int, row: list, licensed: bool = False) -> bool:
+        """Record a row. Returns False if a better row for the license was already seen."""
+        if lic_num in self.emitted:
+            return False
+        if priority == 1:
+            self.best.pop(lic_num, None)
+            self.emitted.add(lic_num)
+            return True
+        existing = self.best.get(lic_num)
+        if existing and priority >= existing[0]:
+            return False
+        self.best[lic_num] = (priority, not licensed, row)
+        return True
+
+    def remaining(self):
+        """Rows for licenses that never had a priority-1 row, most useful first
+        (by type priority, then currently licensed before expired etc.)."""
+        for _, _, row in sorted(self.best.values(), key=lambda e: (e[0], e[1])):
+            yield row
 
+    def close(self):
+        pass
 
-def load_dre_licenses(supabase: Client, csv_path: str) -> dict:
+
+class SqlitePendingRecords(PendingRecords):
+    """PendingRecords kept in a SQLite file, so memory stays flat on huge CSVs."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE pending (lic TEXT PRIMARY KEY, pri INTEGER, cold INTEGER, row TEXT)'
+        )
+
+    def offer(self, lic_num: str, priority: int, row: list, licensed: bool = False) -> bool:
+        # Priority-1 rows are queued by the caller; only their license is kept
+        cur = self.conn.execute(
+            'INSERT INTO pending (lic, pri, cold, row) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(lic) DO UPDATE SET pri = excluded.pri, cold = excluded.cold, row = excluded.row '
+            'WHERE excluded.pri < pending.pri',
+            (lic_num, priority, int(not licensed), None if priority == 1 else json.dumps(row)),
+        )
+        return cur.rowcount > 0
+
+    def remaining(self):
+        for (row,) in self.conn.execute('SELECT row FROM pending WHERE pri > 1 ORDER BY pri, cold'):
+            yield json.loads(row)
+
+    def close(self):
+        self.conn.close()
+
+
+def upsert_batch(supabase: Client, batch: list) -> int:
+    """Upsert one batch of DRE records. Returns the number of rows sent."""
+    supabase.table('dre_licenses').upsert(
+        batch,
+        on_conflict='license_number'
+    ).execute()
+    return len(batch)
+
+
+def load_dre_licenses(supabase: Client, csv_path: str, batch_size: int = BATCH_SIZE,
+                      low_memory: bool = False, priority_only: bool = False) -> dict:
     """Load DRE licenses from CSV into Supabase.
     
     IMPORTANT: One license number can have multiple rows (e.g., Broker + Officer).
     We prefer Broker/Salesperson over Officer/Corporation to ensure we get the
     individual agent's record, not their corporate officer designation.
+    
+    Records are sent most useful first, so an interrupted run still leaves
+    the lookups the app relies on in place: Broker rows as they are read,
+    then the rest by type priority with currently licensed rows first.
+    With priority_only, Corporation rows are skipped entirely.
+    
+    With low_memory, the per-license dedup state lives in a temporary SQLite
+    file instead of Python dicts.
     """
     stats = {'inserted': 0, 'skipped': 0, 'duplicates': 0, 'errors': 0}
     
@@ -93,67 +226,91 @@ def load_dre_licenses(supabase: Client, csv_path: str) -> dict:
         'Corporation': 4,
     }
     
-    # First pass: collect best record for each license
-    print(f"Reading DRE licenses from {csv_path}...")
-    best_records = {}  # license_number -> (priority, record)
+    # Single pass. A Broker row (priority 1) can never be beaten, so it is
+    # queued for upsert as soon as it is read; only licenses still waiting on
+    # a possibly better row stay pending until the end of the file.
+    print(f"Reading DRE licenses from {csv_path} and inserting into Supabase...")
+    queued = 0
     
-    with open(csv_path, encoding='utf-8', errors='replace') as f:
-        reader = csv.DictReader(f)
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        if low_memory:
+            pending = SqlitePendingRecords(os.path.join(tmp_dir, 'pending.sqlite'))
+        else:
+            pending = PendingRecords()
         
-        for row in reader:
-            lic_num = row.get('lic_number', '').strip()
-            if not lic_num:
-                stats['skipped'] += 1
-                continue
-            
-            lic_type = row.get('lic_type', '').strip()
-            priority = TYPE_PRIORITY.get(lic_type, 99)
+        in_flight = {}
+        batch = []
+        
+        def collect(done):
+            for future in done:
+                size = in_flight.pop(future)
+                try:
+                    stats['inserted'] += future.result()
+                except Exception as e:
+                    print(f"  Error inserting batch: {e}")
+                    stats['errors'] += size
+        
+        def submit(records):
+            # Bound the batches waiting on the pool so reading can't run
+            # arbitrarily far ahead of the upserts
+            if len(in_flight) >= MAX_WORKERS * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(upsert_batch, supabase, records)] = len(records)
+        
+        def queue_record(record):
+            nonlocal batch, queued
+            queued += 1
+            if queued % 10000 == 0 or queued == 1:
+                print(f"  [{queued:,}] Queued...")
+            batch.append(record)
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+        
+        with open(csv_path, encoding='utf-8', errors='replace', newline='',
+                  buffering=READ_BUFFER_SIZE) as f:
+            # Plain lists instead of a dict per row; columns are read by position
+            reader = csv.reader(f)
+            header = next(reader, [])
+            pos = column_positions(header)
+            lic_i, type_i, status_i = pos['lic_number'], pos['lic_type'], pos['lic_status']
+            width = len(header)
+            blank = [''] * width
             
-            existing = best_records.get(lic_num)
-            if not existing or priority < existing[0]:
-                best_records[lic_num] = (priority, row)
-            else:
-                stats['duplicates'] += 1
-    
-    total_unique = len(best_records)
-    print(f"  Found {total_unique:,} unique licenses ({stats['duplicates']:,} duplicate rows skipped)")
-    
-    # Second pass: insert best records
-    print(f"Inserting into Supabase...")
-    batch = []
-    
-    for i, (lic_num, (_, row)) in enumerate(best_records.items(), 1):
-        if i % 10000 == 0 or i == 1:
-            print(f"  [{i:,}/{total_unique:,}] Processing...")
+            for row in reader:
+                if len(row) < width:
+                    row += blank[len(row):]
+                lic_num = row[lic_i].strip()
+                if not lic_num:
+                    stats['skipped'] += 1
+                    continue
+                
+                lic_type = row[type_i].strip()
+                priority = TYPE_PRIORITY.get(lic_type, 99)
+                
+                if priority_only and priority == TYPE_PRIORITY['Corporation']:
+                    stats['skipped'] += 1
+                    continue
+                
+                licensed = row[status_i].strip() == 'Licensed'
+                if not pending.offer(lic_num, priority, row, licensed):
+                    stats['duplicates'] += 1
+                elif priority == 1:
+                    queue_record(transform_row(row, pos))
         
-        record = transform_row(row)
-        batch.append(record)
+        # Flush licenses that never had a Broker row
+        for row in pending.remaining():
+            queue_record(transform_row(row, pos))
+        pending.close()
+        if batch:
+            submit(batch)
         
-        if len(batch) >= BATCH_SIZE:
-            try:
-                supabase.table('dre_licenses').upsert(
-                    batch,
-                    on_conflict='license_number'
-                ).execute()
-                stats['inserted'] += len(batch)
-            except Exception as e:
-                print(f"  Error inserting batch: {e}")
-                stats['errors'] += len(batch)
-            batch = []
-    
-    # Insert remaining
-    if batch:
-        try:
-            supabase.table('dre_licenses').upsert(
-                batch,
-                on_conflict='license_number'
-            ).execute()
-            stats['inserted'] += len(batch)
-        except Exception as e:
-            print(f"  Error inserting final batch: {e}")
-            stats['errors'] += len(batch)
+        collect(list(in_flight))
     
-    print(f"  [{total_unique:,}/{total_unique:,}] Done!")
+    print(f"  Found {queued:,} unique licenses ({stats['duplicates']:,} duplicate rows skipped)")
+    print(f"  [{queued:,}/{queued:,}] Done!")
     return stats
 
 
@@ -161,16 +318,25 @@ def main():
     parser = argparse.ArgumentParser(description='Load CA DRE licenses into Supabase')
     parser.add_argument('--file', type=str, default=str(DEFAULT_DRE_FILE),
                         help=f'DRE CSV file (default: {DEFAULT_DRE_FILE})')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'Rows per upsert request (default: {BATCH_SIZE})')
+    parser.add_argument('--priority-only', action='store_true',
+                        help='Skip Corporation licenses')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Gzip upsert request bodies (for slow uplinks)')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='Keep license dedup state in a temporary SQLite file instead of memory')
     args = parser.parse_args()
     
     if not Path(args.file).exists():
         print(f"Error: File not found: {args.file}")
         return
     
-    supabase = get_supabase_client()
+    supabase = get_supabase_client(gzip_requests=args.gzip)
     print(f"Connected to Supabase: {SUPABASE_URL}")
     
-    stats = load_dre_licenses(supabase, args.file)
+    stats = load_dre_licenses(supabase, args.file, batch_size=args.batch_size,
+                              low_memory=args.low_memory, priority_only=args.priority_only)
     
     print(f"\n=== SUMMARY ===")
     print(f"Inserted/Updated: {stats['inserted']:,}")
@@ -0,0 +1,178 @@
+-- Migration: Server-side listing import
+-- Run this in Supabase SQL Editor
+--
+-- import_to_supabase.py used to make 4-6 round-trips per CSV row (listing
+-- upsert, broker select, broker insert/update, broker_emails upsert,
+-- broker_listings upsert). This function does the whole row in one call
+-- and one transaction:
+--
+--   supabase.rpc('import_listing_row', {'p': payload}).execute()
+--
+-- Payload shape:
+--   {
+--     "listing": { "source_url": ..., "address": ..., ... },  -- listings columns
+--     "agents": [
+--       { "license_number": ..., "name": ..., "phone": ..., "brokerage": ...,
+--         "email": ..., "role": "seller" | "buyer" }
+--     ],
+--     "seen_at": "2026-02-25T12:00:00"  -- broker_emails.last_seen_at
+--   }
+--
+-- Listing fields missing from the payload keep their existing values on
+-- conflict, matching the old client-side upsert which dropped None values.
+-- Broker name comes from dre_licenses when the license is found there.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION import_listing_row(p jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  l jsonb := p->'listing';
+  agent jsonb;
+  lid uuid;
+  bid uuid;
+  dre dre_licenses%ROWTYPE;
+  has_dre boolean;
+  canonical_name text;
+  name_from_dre boolean;
+  n_brokers int := 0;
+  n_emails int := 0;
+  n_links int := 0;
+BEGIN
+  IF COALESCE(l->>'source_url', '') = '' THEN
+    RETURN NULL;
+  END IF;
+
+  INSERT INTO listings (
+    source_url, address, city, state, zip, price, beds, baths, sqft,
+    lot_size, year_built, property_type, stories, garage_spaces,
+    price_per_sqft, hoa_dues, status, listing_date, mls_number,
+    days_on_market, description, source_platform, scraped_at,
+    scrape_instance_id
+  )
+  VALUES (
+    l->>'source_url',
+    l->>'address',
+    l->>'city',
+    l->>'state',
+    l->>'zip',
+    (l->>'price')::numeric,
+    (l->>'beds')::int2,
+    (l->>'baths')::numeric,
+    (l->>'sqft')::int4,
+    l->>'lot_size',
+    (l->>'year_built')::int2,
+    l->>'property_type',
+    (l->>'stories')::int2,
+    (l->>'garage_spaces')::int2,
+    (l->>'price_per_sqft')::numeric,
+    (l->>'hoa_dues')::numeric,
+    COALESCE(l->>'status', 'active'),
+    (l->>'listing_date')::date,
+    l->>'mls_number',
+    (l->>'days_on_market')::int4,
+    l->>'description',
+    COALESCE(l->>'source_platform', 'redfin'),
+    (l->>'scraped_at')::timestamptz,
+    (l->>'scrape_instance_id')::uuid
+  )
+  ON CONFLICT (source_url) DO UPDATE SET
+    address = EXCLUDED.address,
+    city = EXCLUDED.city,
+    state = EXCLUDED.state,
+    zip = EXCLUDED.zip,
+    price = COALESCE(EXCLUDED.price, listings.price),
+    beds = COALESCE(EXCLUDED.beds, listings.beds),
+    baths = COALESCE(EXCLUDED.baths, listings.baths),
+    sqft = COALESCE(EXCLUDED.sqft, listings.sqft),
+    lot_size = COALESCE(EXCLUDED.lot_size, listings.lot_size),
+    year_built = COALESCE(EXCLUDED.year_built, listings.year_built),
+    property_type = COALESCE(EXCLUDED.property_type, listings.property_type),
+    stories = COALESCE(EXCLUDED.stories, listings.stories),
+    garage_spaces = COALESCE(EXCLUDED.garage_spaces, listings.garage_spaces),
+    price_per_sqft = COALESCE(EXCLUDED.price_per_sqft, listings.price_per_sqft),
+    hoa_dues = COALESCE(EXCLUDED.hoa_dues, listings.hoa_dues),
+    status = EXCLUDED.status,
+    listing_date = COALESCE(EXCLUDED.listing_date, listings.listing_date),
+    mls_number = COALESCE(EXCLUDED.mls_number, listings.mls_number),
+    days_on_market = COALESCE(EXCLUDED.days_on_market, listings.days_on_market),
+    description = EXCLUDED.description,
+    source_platform = EXCLUDED.source_platform,
+    scraped_at = COALESCE(EXCLUDED.scraped_at, listings.scraped_at),
+    scrape_instance_id = COALESCE(EXCLUDED.scrape_instance_id, listings.scrape_instance_id)
+  RETURNING id INTO lid;
+
+  FOR agent IN SELECT * FROM jsonb_array_elements(COALESCE(p->'agents', '[]'::jsonb)) LOOP
+    CONTINUE WHEN COALESCE(agent->>'license_number', '') = '';
+
+    -- Canonical name: prefer DRE, fall back to scraped
+    SELECT * INTO dre FROM dre_licenses WHERE license_number = agent->>'license_number';
+    has_dre := FOUND;
+    name_from_dre := has_dre AND COALESCE(dre.full_name, '') <> '';
+    canonical_name := CASE WHEN name_from_dre THEN dre.full_name
+                           ELSE NULLIF(agent->>'name', '') END;
+
+    INSERT INTO brokers (
+      license_number, name, phone, brokerage_name, state_licensed,
+      dre_verified, name_from_dre, dre_license_id
+    )
+    VALUES (
+      agent->>'license_number',
+      canonical_name,
+      NULLIF(agent->>'phone', ''),
+      NULLIF(agent->>'brokerage', ''),
+      'CA',
+      has_dre,
+      name_from_dre,
+      CASE WHEN has_dre THEN dre.id END
+    )
+    ON CONFLICT (license_number) DO UPDATE SET
+      name = CASE WHEN EXCLUDED.name_from_dre THEN EXCLUDED.name ELSE brokers.name END,
+      name_from_dre = CASE WHEN EXCLUDED.name_from_dre THEN true ELSE brokers.name_from_dre END,
+      dre_license_id = COALESCE(EXCLUDED.dre_license_id, brokers.dre_license_id),
+      dre_verified = CASE WHEN EXCLUDED.dre_verified THEN true ELSE brokers.dre_verified END,
+      phone = COALESCE(EXCLUDED.phone, brokers.phone),
+      brokerage_name = COALESCE(EXCLUDED.brokerage_name, brokers.brokerage_name)
+    RETURNING id INTO bid;
+    n_brokers := n_brokers + 1;
+
+    IF COALESCE(agent->>'email', '') <> '' THEN
+      INSERT INTO broker_emails (broker_id, email, source_listing_id, last_seen_at)
+      VALUES (
+        bid,
+        agent->>'email',
+        lid,
+        COALESCE((p->>'seen_at')::timestamptz, now())
+      )
+      ON CONFLICT (broker_id, email) DO UPDATE SET
+        source_listing_id = EXCLUDED.source_listing_id,
+        last_seen_at = EXCLUDED.last_seen_at;
+      n_emails := n_emails + 1;
+    END IF;
+
+    INSERT INTO broker_listings (broker_id, listing_id, role)
+    VALUES (bid, lid, agent->>'role')
+    ON CONFLICT (broker_id, listing_id, role) DO NOTHING;
+    n_links := n_links + 1;
+  END LOOP;
+
+  RETURN jsonb_build_object(
+    'listing_id', lid,
+    'brokers', n_brokers,
+    'emails', n_emails,
+    'links', n_links
+  );
+END;
+$$;
+
+COMMENT ON FUNCTION import_listing_row(jsonb) IS 'Upsert one scraped listing with its agents, emails and broker links in a single call (used by import_to_supabase.py)';
+
+COMMIT;
+
+-- ============================================
+-- VERIFICATION QUERIES
+-- ============================================
+
+-- SELECT import_listing_row('{"listing": {"source_url": "https://example.com/test", "address": "1 Test St"}, "agents": []}'::jsonb);
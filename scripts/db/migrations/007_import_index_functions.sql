@@ -0,0 +1,77 @@
+-- Migration: Drop/recreate secondary indexes around bulk imports
+-- Run this in Supabase SQL Editor
+--
+-- import_demo.py clears listings/brokers and reloads them row by row, so
+-- every insert pays for index maintenance. For that fresh load it calls
+--
+--   supabase.rpc('drop_import_indexes')      -- after clear_all_data
+--   supabase.rpc('recreate_import_indexes')  -- after the import finishes
+--
+-- Only plain secondary indexes are dropped. Primary keys and UNIQUE
+-- constraints (listings.source_url, brokers.license_number,
+-- broker_listings(broker_id, listing_id, role)) stay in place because the
+-- import relies on them for upserts and existence checks.
+--
+-- Indexes dropped and recreated:
+--   idx_listings_status          listings(status)
+--   idx_listings_zip             listings(zip)
+--   idx_listings_city            listings(city)
+--   idx_listings_price           listings(price)
+--   idx_listings_scrape_instance listings(scrape_instance_id)
+--   idx_broker_listings_broker   broker_listings(broker_id)
+--   idx_broker_listings_listing  broker_listings(listing_id)
+--
+-- DROP INDEX CONCURRENTLY cannot run inside a function, so these take a
+-- brief lock; they are meant for the demo reload, not for live tables.
+--
+-- The API roles don't own these tables, so both functions run as their
+-- owner (SECURITY DEFINER, with a fixed search_path). Only service_role may
+-- call them; anon/authenticated keys cannot drop the indexes.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION drop_import_indexes()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  DROP INDEX IF EXISTS idx_listings_status;
+  DROP INDEX IF EXISTS idx_listings_zip;
+  DROP INDEX IF EXISTS idx_listings_city;
+  DROP INDEX IF EXISTS idx_listings_price;
+  DROP INDEX IF EXISTS idx_listings_scrape_instance;
+  DROP INDEX IF EXISTS idx_broker_listings_broker;
+  DROP INDEX IF EXISTS idx_broker_listings_listing;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION recreate_import_indexes()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  CREATE INDEX IF NOT EXISTS idx_listings_status ON listings(status);
+  CREATE INDEX IF NOT EXISTS idx_listings_zip ON listings(zip);
+  CREATE INDEX IF NOT EXISTS idx_listings_city ON listings(city);
+  CREATE INDEX IF NOT EXISTS idx_listings_price ON listings(price);
+  CREATE INDEX IF NOT EXISTS idx_listings_scrape_instance ON listings(scrape_instance_id);
+  CREATE INDEX IF NOT EXISTS idx_broker_listings_broker ON broker_listings(broker_id);
+  CREATE INDEX IF NOT EXISTS idx_broker_listings_listing ON broker_listings(listing_id);
+  ANALYZE listings;
+  ANALYZE broker_listings;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION drop_import_indexes() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION recreate_import_indexes() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION drop_import_indexes() TO service_role;
+GRANT EXECUTE ON FUNCTION recreate_import_indexes() TO service_role;
+
+COMMENT ON FUNCTION drop_import_indexes() IS 'Drop secondary listing indexes before a bulk demo import (see import_demo.py)';
+COMMENT ON FUNCTION recreate_import_indexes() IS 'Recreate the indexes dropped by drop_import_indexes()';
+
+COMMIT;
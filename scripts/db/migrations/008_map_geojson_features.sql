@@ -0,0 +1,67 @@
+-- Migration: Staged per-feature upload for map_geojson
+-- Run this in Supabase SQL Editor (after 005_map_geojson.sql)
+--
+-- upload_map_geojson.py used to send the whole FeatureCollection as one
+-- upsert body, holding the parsed file and its serialized copy in memory
+-- at once and running into PostgREST's request size limit on large layers.
+-- It now streams features into map_geojson_features in batches and then
+-- assembles the collection server-side:
+--
+--   supabase.rpc('build_map_geojson', {
+--       'p_name': 'socal_zctas',
+--       'p_members': {'name': ..., 'crs': {...}},  -- other top-level members
+--   }).execute()
+--
+-- The map_geojson row the frontend reads is unchanged: p_members carries the
+-- file's top-level members besides type and features, and they are merged
+-- back into the assembled collection.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS map_geojson_features (
+  layer TEXT NOT NULL,
+  idx INTEGER NOT NULL,
+  feature JSONB NOT NULL,
+  PRIMARY KEY (layer, idx)
+);
+
+COMMENT ON TABLE map_geojson_features IS 'Upload staging for map_geojson: one row per GeoJSON feature, in file order';
+
+ALTER TABLE map_geojson_features ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow service role full access to map_geojson_features"
+  ON map_geojson_features FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION build_map_geojson(p_name text, p_members jsonb DEFAULT '{}'::jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  n integer;
+BEGIN
+  INSERT INTO map_geojson (name, geojson, updated_at)
+  SELECT
+    p_name,
+    p_members || jsonb_build_object(
+      'type', 'FeatureCollection',
+      'features', COALESCE(jsonb_agg(feature ORDER BY idx), '[]'::jsonb)
+    ),
+    now()
+  FROM map_geojson_features
+  WHERE layer = p_name
+  ON CONFLICT (name) DO UPDATE SET
+    geojson = EXCLUDED.geojson,
+    updated_at = EXCLUDED.updated_at;
+
+  SELECT count(*) INTO n FROM map_geojson_features WHERE layer = p_name;
+  DELETE FROM map_geojson_features WHERE layer = p_name;
+  RETURN n;
+END;
+$$;
+
+COMMENT ON FUNCTION build_map_geojson(text, jsonb) IS 'Assemble a map_geojson FeatureCollection from staged features and clear the staging rows (used by upload_map_geojson.py)';
+
+COMMIT;
@@ -0,0 +1,35 @@
+-- Migration: Stored full_address column on listings
+-- Run this in Supabase SQL Editor
+--
+-- enrich_supabase_listings_geopoints.py geocodes "address, city, state, zip"
+-- and used to join those fields per row in Python. Postgres now keeps the
+-- joined string up to date itself, so the script selects it directly:
+--
+--   client.table('listings').select('id,address,full_address,latitude,longitude')
+--
+-- Blank or NULL parts are skipped; full_address is NULL when all are blank.
+-- concat_ws/array_to_string are only STABLE, and generated columns need an
+-- IMMUTABLE expression, hence the || chain (substr drops the leading ', ').
+
+BEGIN;
+
+ALTER TABLE listings
+  ADD COLUMN IF NOT EXISTS full_address TEXT GENERATED ALWAYS AS (
+    NULLIF(substr(
+      COALESCE(', ' || NULLIF(btrim(address), ''), '') ||
+      COALESCE(', ' || NULLIF(btrim(city), ''), '') ||
+      COALESCE(', ' || NULLIF(btrim(state), ''), '') ||
+      COALESCE(', ' || NULLIF(btrim(zip), ''), ''),
+      3
+    ), '')
+  ) STORED;
+
+COMMENT ON COLUMN listings.full_address IS 'address, city, state, zip joined with ", " (generated; used for geocoding)';
+
+COMMIT;
+
+-- ============================================
+-- VERIFICATION QUERIES
+-- ============================================
+
+-- SELECT id, address, city, state, zip, full_address FROM listings LIMIT 10;
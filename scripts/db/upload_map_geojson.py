@@ -5,22 +5,29 @@ Upload SoCal ZCTA GeoJSON to Supabase map_geojson table.
 Reads frontend/public/socal_zctas.geojson (or the path you pass) and upserts
 a row with name='socal_zctas' so the frontend can load the map from Supabase.
 
+Features are streamed from the file and staged in batches, then the
+FeatureCollection is assembled server-side, so memory stays at about one batch.
+Its other top-level members (e.g. name, crs) are read separately and kept.
+
 Requires:
   - Table map_geojson (run scripts/db/migrations/005_map_geojson.sql in Supabase first)
+  - Staging table + build_map_geojson() (scripts/db/migrations/008_map_geojson_features.sql)
   - SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_ROLE_KEY for write if RLS restricts anon)
 
 Usage:
   python scripts/db/upload_map_geojson.py
   python scripts/db/upload_map_geojson.py --file frontend/public/socal_zctas.geojson
+  python scripts/db/upload_map_geojson.py --gzip   # compress request bodies
 """
 
 import argparse
-import json
 import os
 from pathlib import Path
 
+import ijson
 from dotenv import load_dotenv
-from supabase import create_client
+
+from supabase_client import create_pooled_client
 
 # Load .env from repo root, then scripts/.env.local (so scripts/.env.local wins)
 repo_root = Path(__file__).resolve().parent.parent.parent
@@ -37,6 +44,47 @@ SUPABASE_KEY = (
 LAYER_NAME = "socal_zctas"
 DEFAULT_FILE = Path(__file__).resolve().parent.parent.parent / "frontend" / "public" / "socal_zctas.geojson"
 
+# Features per staging insert; ZCTA polygons can be a few hundred KB each
+FEATURE_BATCH_SIZE = 100
+
+
+def stage_features(client, path, batch_size=FEATURE_BATCH_SIZE):
+    """Stream features from the file into map_geojson_features. Returns the count."""
+    staging = client.table("map_geojson_features")
+    staging.delete().eq("layer", LAYER_NAME).execute()
+
+    count = 0
+    batch = []
+    with open(path, "rb") as f:
+        for feature in ijson.items(f, "features.item", use_float=True):
+            batch.append({"layer": LAYER_NAME, "idx": count, "feature": feature})
+            count += 1
+            if len(batch) >= batch_size:
+                staging.insert(batch).execute()
+                batch = []
+                print(f"  Staged {count} features...")
+    if batch:
+        staging.insert(batch).execute()
+    return count
+
+
+def read_collection_members(path):
+    """The FeatureCollection's top-level members other than type and features."""
+    members = {}
+    key = builder = None
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == "":
+                # Back at the top level, so the previous member is complete
+                if builder is not None:
+                    members[key] = builder.value
+                    builder = None
+                if event == "map_key" and value not in ("type", "features"):
+                    key, builder = value, ijson.ObjectBuilder()
+            elif builder is not None:
+                builder.event(event, value)
+    return members
+
 
 def main():
     parser = argparse.ArgumentParser(description="Upload SoCal ZCTA GeoJSON to Supabase map_geojson")
@@ -46,6 +94,7 @@ def main():
         default=DEFAULT_FILE,
         help=f"Path to GeoJSON file (default: {DEFAULT_FILE})",
     )
+    parser.add_argument("--gzip", action="store_true", help="Gzip the upload request bodies")
     args = parser.parse_args()
 
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -55,20 +104,18 @@ def main():
     if not args.file.exists():
         raise SystemExit(f"File not found: {args.file}. Run build_socal_zctas.py first.")
 
-    with open(args.file, "r", encoding="utf-8") as f:
-        geojson = json.load(f)
-
-    if "type" not in geojson or "features" not in geojson:
-        raise SystemExit("GeoJSON must be a FeatureCollection with 'type' and 'features'.")
+    client = create_pooled_client(SUPABASE_URL, SUPABASE_KEY, gzip_requests=args.gzip)
 
-    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    staged = stage_features(client, args.file)
+    if not staged:
+        raise SystemExit("GeoJSON must be a FeatureCollection with a non-empty 'features' array.")
 
-    row = {"name": LAYER_NAME, "geojson": geojson}
-    result = client.table("map_geojson").upsert(row, on_conflict="name").execute()
+    members = read_collection_members(args.file)
+    result = client.rpc(
+        "build_map_geojson", {"p_name": LAYER_NAME, "p_members": members}
+    ).execute()
 
-    print(f"Uploaded '{LAYER_NAME}' to map_geojson ({len(geojson.get('features', []))} features).")
-    if result.data:
-        print(f"  Row id: {result.data[0].get('id')}")
+    print(f"Uploaded '{LAYER_NAME}' to map_geojson ({result.data} features).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,20 @@
+"""
+Minimal .env reader shared by the geopoints scripts.
+
+Usage (from a script in this directory; scripts in subdirectories put this
+directory on sys.path first):
+    from _env import read_env
+    os.environ.update(read_env(".env"))
+"""
+
+import re
+
+# KEY=value lines of a .env file (comments and blank lines don't match)
+ENV_LINE = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=(.*)$", re.M)
+
+
+def read_env(path):
+    """Return the KEY=value pairs of a .env file, with values unquoted."""
+    with open(path) as f:
+        text = f.read()
+    return {m.group(1): m.group(2).strip().strip('"').strip("'") for m in ENV_LINE.finditer(text)}
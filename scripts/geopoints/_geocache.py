@@ -0,0 +1,51 @@
+"""
+Shared SQLite cache for the geopoints scripts.
+
+Google geocodes, parcel queries and census lookups from every script in
+this directory are stored in the same data/cache/geo_cache.sqlite, so the
+cache and its key formats live here rather than being copied per script.
+
+Usage (from a script in this directory; scripts in subdirectories put this
+directory on sys.path first):
+    from _geocache import CACHE_FILE, GeoCache, geocode_key
+    cache = GeoCache(CACHE_FILE)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+CACHE_FILE = Path(__file__).resolve().parent.parent.parent / "data" / "cache" / "geo_cache.sqlite"
+
+
+class GeoCache:
+    """Persistent JSON cache in SQLite, shared by the worker threads."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS geo_cache (key TEXT PRIMARY KEY, value TEXT)")
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM geo_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO geo_cache (key, value) VALUES (?, ?)",
+                              (key, json.dumps(value)))
+            self.conn.commit()
+
+
+def geocode_key(address):
+    """Cache key for a Google geocode, by normalized address."""
+    return "google_geocode:" + " ".join(address.upper().split())
+
+
+def latlon_key(prefix, lat, lon):
+    """Cache key with coordinates rounded to 5 decimals (~1m)."""
+    return f"{prefix}:{round(float(lat), 5)},{round(float(lon), 5)}"
@@ -0,0 +1,63 @@
+"""
+Throttled Google Maps API client shared by the geopoints geocoding scripts.
+
+Usage (from a script in this directory; scripts in subdirectories put this
+directory on sys.path first):
+    from _google import GEOCODE_URL, GoogleClient
+    google = GoogleClient("MyScript/1.0", RateLimiter(40, burst=40))
+    data = google.get(GEOCODE_URL, {"address": address, "key": api_key}, timeout=15)
+"""
+
+import random
+
+import httpx
+import orjson
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+GOOGLE_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+
+
+def backoff_delay(resp, attempt):
+    """Retry-After if the server sent one, else jittered exponential backoff."""
+    retry_after = resp.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF_BASE * 2 ** attempt + random.uniform(0, BACKOFF_BASE)
+
+
+class GoogleClient:
+    """Keep-alive session shared by the geocode workers (HTTP/2, so they
+    multiplex over a few connections to Google), paced by `limiter`. The
+    transport retries failed connects; get() retries throttled/transient
+    statuses."""
+
+    def __init__(self, user_agent, limiter):
+        self.session = httpx.Client(
+            headers={"User-Agent": user_agent},
+            transport=httpx.HTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            ),
+        )
+        self.limiter = limiter
+
+    def get(self, url, params, timeout):
+        """GET a Google API URL and return its JSON, backing off while throttled.
+
+        A 429/5xx or an OVER_QUERY_LIMIT body pauses the shared limiter, so every
+        worker slows down rather than only the one that was refused.
+        """
+        for attempt in range(GOOGLE_RETRIES + 1):
+            self.limiter.wait()
+            resp = self.session.get(url, params=params, timeout=timeout)
+            last = attempt == GOOGLE_RETRIES
+            if resp.status_code not in RETRY_STATUSES or last:
+                resp.raise_for_status()
+                data = orjson.loads(resp.content)
+                if data.get("status") != "OVER_QUERY_LIMIT" or last:
+                    return data
+            self.limiter.pause(backoff_delay(resp, attempt))
@@ -10,12 +10,22 @@ Usage:
 """
 
 import csv
-import json
-import os
 import sys
-import time
-import urllib.request
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from _env import read_env
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
+from common.streaming import replace_on_success, stream_in_order
 
 ENV_FILE = ".env"
 INPUT_FILE = "data/tmf/deals_rows_with_parcels.csv"
@@ -23,26 +33,32 @@ OUTPUT_FILE = "data/tmf/deals_rows_with_parcels.csv"
 
 ATTOM_BASE = "https://api.gateway.attomdata.com/propertyapi/v1.0.0"
 
+# Keep-alive session for the ATTOM host, retrying throttled/transient errors
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 2
 
-def load_env():
-    keys = {}
-    with open(ENV_FILE) as f:
-        for line in f:
-            if "=" in line and not line.startswith("#"):
-                k, v = line.strip().split("=", 1)
-                keys[k] = v
-    return keys
+
+LIMITER = RateLimiter(REQUESTS_PER_SECOND)
 
 
 def attom_fetch(endpoint, params, api_key):
     qs = urllib.parse.urlencode(params)
     url = f"{ATTOM_BASE}/{endpoint}?{qs}"
-    req = urllib.request.Request(url, headers={
+    LIMITER.wait()
+    resp = SESSION.get(url, headers={
         "Accept": "application/json",
         "APIKey": api_key,
-    })
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read().decode())
+    }, timeout=30)
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
 
 
 def lookup_by_address(address_line, city_state, api_key):
@@ -117,57 +133,78 @@ def try_owner_lookup(prop):
 
 
 def main():
-    env = load_env()
+    env = read_env(ENV_FILE)
     api_key = env.get("ATTOM_API_KEY")
     if not api_key:
         print("ATTOM_API_KEY not found in .env")
         sys.exit(1)
 
-    with open(INPUT_FILE, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        deals = list(reader)
-
-    missing = [(i, d) for i, d in enumerate(deals) if not d.get("parcel_apn")]
-    print(f"Total deals: {len(deals)}, missing parcel: {len(missing)}")
-    print()
-
+    # Rows are streamed: each is written (in input order) as soon as its
+    # lookup finishes, into a temp file that replaces the output at the end.
+    # Rows that already have a parcel_apn are passed through untouched, so an
+    # interrupted run can simply be re-run.
+    window = MAX_WORKERS * 4
+    total = 0
     matched = 0
-    for idx, deal in missing:
+
+    def street_and_city_state(deal):
         addr = deal.get("address", "")
         cs = deal.get("city_state", "")
 
         # Parse street address from full address (strip city/state)
         addr_parts = addr.split(",")
         street = addr_parts[0].strip() if addr_parts else addr
-
-        print(f"[{deal['id']}] {street} | {cs}")
-
-        prop = lookup_by_address(street, cs, api_key)
-        time.sleep(1.0)
-
-        if prop:
-            fields = extract_parcel_fields(prop)
-            owner = try_owner_lookup(prop)
-            if owner:
-                fields["parcel_owner"] = owner
-
-            for k, v in fields.items():
-                deal[k] = v
-
-            if fields.get("parcel_apn"):
-                matched += 1
-                print(f"  -> APN {fields['parcel_apn']}  Owner: {fields.get('parcel_owner', '?')}")
+        return street, cs
+
+    def write_result(writer, deal, future):
+        nonlocal total, matched
+        total += 1
+        if future is not None:
+            street, cs = street_and_city_state(deal)
+            prop = future.result()
+
+            print(f"[{deal['id']}] {street} | {cs}")
+
+            if prop:
+                fields = extract_parcel_fields(prop)
+                owner = try_owner_lookup(prop)
+                if owner:
+                    fields["parcel_owner"] = owner
+
+                for k, v in fields.items():
+                    deal[k] = v
+
+                if fields.get("parcel_apn"):
+                    matched += 1
+                    print(f"  -> APN {fields['parcel_apn']}  Owner: {fields.get('parcel_owner', '?')}")
+                else:
+                    print(f"  -> ATTOM hit but no APN")
             else:
-                print(f"  -> ATTOM hit but no APN")
-        else:
-            print(f"  -> no ATTOM match")
-
-    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+                print(f"  -> no ATTOM match")
+        writer.writerow(deal)
+
+    # The output is replaced only after the input is closed (they are the
+    # same file)
+    with replace_on_success(OUTPUT_FILE) as fout, \
+            open(INPUT_FILE, newline="", encoding="utf-8") as fin:
+        reader = csv.DictReader(fin)
+        writer = csv.DictWriter(fout, fieldnames=reader.fieldnames, extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(deals)
 
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            def submit(deal):
+                if deal.get("parcel_apn"):
+                    return None
+                return executor.submit(lookup_by_address, *street_and_city_state(deal), api_key)
+
+            stream_in_order(
+                reader,
+                submit,
+                lambda deal, future: write_result(writer, deal, future),
+                window,
+            )
+
+    print(f"Total deals: {total}")
     print(f"\nDone: {matched} new parcel matches from ATTOM")
     print(f"Updated: {OUTPUT_FILE}")
 
@@ -1,16 +1,48 @@
+import argparse
 import csv
-import urllib.request
+import os
 import urllib.parse
-import json
-import time
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+import orjson
+
+# The shared geopoints helpers live one directory up, and the helpers shared
+# across script directories in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+from _geocache import CACHE_FILE, GeoCache, latlon_key
+from common.rate_limiter import RateLimiter
 
 FILE = "data/tmf/deals_rows.csv"
 
 GEOCODE_URL = "https://geocoding.geo.census.gov/geocoder/geographies/coordinates"
 
+# One keep-alive session for all rows instead of a new TLS handshake per call
+# (HTTP/2, so the worker threads multiplex over a few connections).
+SESSION = httpx.Client(
+    http2=True,
+    headers={"User-Agent": "ListingEnricher/1.0"},
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    follow_redirects=True,
+)
+
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 5
+
+
+LIMITER = RateLimiter(REQUESTS_PER_SECOND)
+
+
+def reverse_geocode(lat, lon, cache):
+    key = latlon_key("census", lat, lon)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
 
-def reverse_geocode(lat, lon):
     params = urllib.parse.urlencode({
         "x": lon,
         "y": lat,
@@ -19,10 +51,11 @@ def reverse_geocode(lat, lon):
         "format": "json",
     })
     url = f"{GEOCODE_URL}?{params}"
+    LIMITER.wait()
     try:
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = json.loads(resp.read().decode())
+        resp = SESSION.get(url, timeout=15)
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
 
         geos = data.get("result", {}).get("geographies", {})
 
@@ -31,7 +64,7 @@ def reverse_geocode(lat, lon):
         cousub_info = (geos.get("County Subdivisions") or [{}])[0]
         tract_info = (geos.get("Census Tracts") or [{}])[0]
 
-        return {
+        geo = {
             "state_fips": state_info.get("STATE", ""),
             "county_fips": county_info.get("COUNTY", ""),
             "county_geoid": county_info.get("GEOID", ""),
@@ -40,54 +73,87 @@ def reverse_geocode(lat, lon):
             "cousub_name": cousub_info.get("BASENAME", ""),
             "tract_geoid": tract_info.get("GEOID", ""),
         }
+        cache.set(key, geo)
+        return geo
     except Exception as e:
         print(f"  ERROR: {e}", file=sys.stderr)
         return {}
 
 
-with open(FILE, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    old_fields = reader.fieldnames
-    rows = list(reader)
+parser = argparse.ArgumentParser(description="Add Census county/tract GEOIDs to deals CSV")
+parser.add_argument("--resume", action="store_true",
+                    help="Keep rows that already have a tract_geoid instead of re-querying")
+args = parser.parse_args()
 
 GEO_FIELDS = [
     "state_fips", "county_fips", "county_geoid",
     "county_name", "cousub_geoid", "cousub_name", "tract_geoid",
 ]
 
-new_fields = old_fields + [f for f in GEO_FIELDS if f not in old_fields]
+# Bounded number of rows waiting on a lookup, so the file is never fully in memory
+WINDOW = MAX_WORKERS * 4
 
-total = len(rows)
+total = 0
 matched = 0
+tmp_path = FILE + ".tmp"
 
-for i, row in enumerate(rows):
-    lat = row.get("latitude", "").strip()
-    lon = row.get("longitude", "").strip()
 
-    if not lat or not lon:
-        print(f"[{row['id']}] No coordinates, skipping")
-        for f in GEO_FIELDS:
-            row[f] = ""
-        continue
+def write_result(writer, i, row, future):
+    """Apply one finished lookup to its row and stream it to the output."""
+    global matched
+    if future is not None:
+        geo = future.result()
 
-    print(f"[{i+1}/{total}] {row['display_name']}")
-    geo = reverse_geocode(lat, lon)
-    time.sleep(0.3)
+        print(f"[{i+1}] {row['display_name']}")
+        if geo.get("county_geoid"):
+            matched += 1
+            print(f"  -> {geo['county_name']} County ({geo['county_geoid']}), tract {geo['tract_geoid']}")
+        else:
+            print(f"  -> NO GEO MATCH")
 
-    if geo.get("county_geoid"):
-        matched += 1
-        print(f"  -> {geo['county_name']} County ({geo['county_geoid']}), tract {geo['tract_geoid']}")
-    else:
-        print(f"  -> NO GEO MATCH")
+        for f in GEO_FIELDS:
+            row[f] = geo.get(f, "")
+    writer.writerow(row)
 
-    for f in GEO_FIELDS:
-        row[f] = geo.get(f, "")
 
-print(f"\nDone: {matched}/{total} matched")
+# Opened after argparse, so --help and usage errors don't create the cache file
+cache = GeoCache(CACHE_FILE)
 
-with open(FILE, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=new_fields)
+with open(FILE, newline="", encoding="utf-8") as fin, \
+        open(tmp_path, "w", newline="", encoding="utf-8") as fout:
+    reader = csv.DictReader(fin)
+    old_fields = reader.fieldnames
+    new_fields = old_fields + [f for f in GEO_FIELDS if f not in old_fields]
+
+    writer = csv.DictWriter(fout, fieldnames=new_fields)
     writer.writeheader()
-    writer.writerows(rows)
 
+    # Rows are written in input order as soon as their lookup (if any) is done
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for i, row in enumerate(reader):
+            total += 1
+            lat = row.get("latitude", "").strip()
+            lon = row.get("longitude", "").strip()
+
+            if args.resume and row.get("tract_geoid"):
+                matched += 1
+                pending.append((i, row, None))
+            elif not lat or not lon:
+                print(f"[{row['id']}] No coordinates, skipping")
+                for f in GEO_FIELDS:
+                    row[f] = ""
+                pending.append((i, row, None))
+            else:
+                pending.append((i, row, executor.submit(reverse_geocode, lat, lon, cache)))
+
+            while pending and (len(pending) > WINDOW or pending[0][2] is None or pending[0][2].done()):
+                write_result(writer, *pending.popleft())
+
+        while pending:
+            write_result(writer, *pending.popleft())
+
+os.replace(tmp_path, FILE)
+
+print(f"\nDone: {matched}/{total} matched")
 print(f"Updated {FILE} with {len(GEO_FIELDS)} new columns")
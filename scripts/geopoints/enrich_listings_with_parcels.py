@@ -13,19 +13,43 @@ Usage:
 
     # Dry run (show what would be processed)
     python scripts/geopoints/enrich_listings_with_parcels.py --input data/listings/daily/all_listings_2026-02-25.csv --dry-run
+
+    # Match against a local copy of the parcel layer (downloaded on first use)
+    python scripts/geopoints/enrich_listings_with_parcels.py --input data/listings/daily/all_listings_2026-02-25.csv --local-parcels
 """
 
 import argparse
 import csv
-import json
 import os
 import sys
-import time
 import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import httpx
+import orjson
+
+from _geocache import CACHE_FILE, GeoCache, geocode_key, latlon_key
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
 
 ENV_FILE = ".env"
 
+# Local copy of the SD parcel layer for --local-parcels (needs geopandas)
+LOCAL_PARCELS_FILE = "data/boundaries/san-diego/parcels_sd_enrich.gpkg"
+LOCAL_PAGE_SIZE = 2000
+
+# Attributes read by lookup_single / score_address_match
+PARCEL_FIELDS = [
+    "APN", "APN_8", "OWN_NAME1",
+    "ASR_TOTAL", "ASR_LAND", "ASR_IMPR",
+    "TOTAL_LVG_AREA", "ACREAGE", "BEDROOMS", "BATHS",
+    "SITUS_ADDRESS", "SITUS_PRE_DIR", "SITUS_STREET", "SITUS_SUFFIX",
+    "SITUS_COMMUNITY", "SITUS_ZIP",
+]
+
 SD_PARCELS_URL = (
     "https://gis-public.sandiegocounty.gov/arcgis/rest/services/"
     "sdep_warehouse/PARCELS_ALL/FeatureServer/0/query"
@@ -33,6 +57,30 @@ SD_PARCELS_URL = (
 
 GOOGLE_GEO_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 
+# One keep-alive session shared by the Google and ArcGIS calls
+# (HTTP/2, so the worker threads multiplex over a few connections).
+SESSION = httpx.Client(
+    http2=True,
+    headers={"User-Agent": "ListingEnricher/1.0"},
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    follow_redirects=True,
+)
+
+# Google and ArcGIS are throttled separately so geocodes never wait on parcel
+# queries; Google's per-user cap is well above GOOGLE_REQUESTS_PER_SECOND.
+MAX_WORKERS = 10
+GOOGLE_REQUESTS_PER_SECOND = 10
+ARCGIS_REQUESTS_PER_SECOND = 10
+
+
+GOOGLE_LIMITER = RateLimiter(GOOGLE_REQUESTS_PER_SECOND)
+ARCGIS_LIMITER = RateLimiter(ARCGIS_REQUESTS_PER_SECOND)
+
+
+# GeoCache over CACHE_FILE, opened by the entry point only when lookups will
+# run, so --help and --dry-run don't create the cache file
+CACHE = None
+
 SD_ZIPS = {
     "92037", "92014", "92075", "92024", "92007",
     "92118", "92106", "92107", "92109",
@@ -52,41 +100,63 @@ def load_api_key():
     raise RuntimeError("GOOGLE_GEOCODING_API_KEY not found in .env or environment")
 
 
-def fetch_json(url, timeout=30):
-    req = urllib.request.Request(url, headers={"User-Agent": "ListingEnricher/1.0"})
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode())
+def fetch_json(url, timeout=30, limiter=ARCGIS_LIMITER):
+    limiter.wait()
+    resp = SESSION.get(url, timeout=timeout)
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
 
 
 def geocode_address(address, api_key):
+    key = geocode_key(address)
+    cached = CACHE.get(key)
+    if cached is not None:
+        return tuple(cached)
+
     params = urllib.parse.urlencode({"address": address, "key": api_key})
-    data = fetch_json(f"{GOOGLE_GEO_URL}?{params}")
+    data = fetch_json(f"{GOOGLE_GEO_URL}?{params}", limiter=GOOGLE_LIMITER)
+    if data.get("status") == "ZERO_RESULTS":
+        CACHE.set(key, [None, None])
     if data.get("status") != "OK" or not data.get("results"):
         return None, None
     loc = data["results"][0]["geometry"]["location"]
+    CACHE.set(key, [loc["lat"], loc["lng"]])
     return loc["lat"], loc["lng"]
 
 
-def score_address_match(parcel_attrs, input_address):
-    input_upper = input_address.upper()
-    input_parts = set(input_upper.replace(",", " ").split())
+def address_tokens(address):
+    """Upper-cased words of an input address, for score_address_match."""
+    return frozenset(address.upper().replace(",", " ").split())
 
-    situs_num = str(parcel_attrs.get("SITUS_ADDRESS", "")).strip()
+
+def parcel_tokens(parcel_attrs):
+    """(house number, street words, suffix) of a parcel's situs address."""
+    situs_num = parcel_attrs.get("SITUS_ADDRESS")
+    if isinstance(situs_num, float) and situs_num.is_integer():
+        situs_num = int(situs_num)  # numeric columns with gaps load as float
+    situs_num = str(situs_num if situs_num is not None else "").strip()
     situs_street = (parcel_attrs.get("SITUS_STREET") or "").strip().upper()
     situs_suffix = (parcel_attrs.get("SITUS_SUFFIX") or "").strip().upper()
+    return situs_num, frozenset(situs_street.split()), situs_suffix
+
 
-    score = 0
+def score_address_match(tokens, input_parts):
+    situs_num, street_words, situs_suffix = tokens
+    score = 5 * len(street_words & input_parts)
     if situs_num and situs_num in input_parts:
         score += 10
-    for word in situs_street.split():
-        if word in input_parts:
-            score += 5
     if situs_suffix and situs_suffix in input_parts:
         score += 2
     return score
 
 
-def find_parcel(lat, lon, input_address=""):
+def query_parcel_features(lat, lon):
+    """Parcels intersecting a small envelope around the point (cached on disk)."""
+    key = latlon_key("sd_parcels", lat, lon)
+    cached = CACHE.get(key)
+    if cached is not None:
+        return cached
+
     buf = 0.0003
     envelope = f"{lon - buf},{lat - buf},{lon + buf},{lat + buf}"
     params = urllib.parse.urlencode({
@@ -100,27 +170,97 @@ def find_parcel(lat, lon, input_address=""):
     })
     url = f"{SD_PARCELS_URL}?{params}"
 
+    data = fetch_json(url)
+    features = data.get("features", [])
+    CACHE.set(key, features)
+    return features
+
+
+def download_local_parcels(path=LOCAL_PARCELS_FILE):
+    """Page through PARCELS_ALL for the SD zips once and save a GeoPackage."""
+    import geopandas as gpd
+
+    features = []
+    for zip_code in sorted(SD_ZIPS):
+        offset = 0
+        while True:
+            params = urllib.parse.urlencode({
+                "where": f"SITUS_ZIP LIKE '{zip_code}%'",
+                "outFields": ",".join(PARCEL_FIELDS),
+                "returnGeometry": "true",
+                "outSR": "4326",
+                "resultOffset": offset,
+                "resultRecordCount": LOCAL_PAGE_SIZE,
+                "orderByFields": "OBJECTID ASC",
+                "f": "geojson",
+            })
+            page = fetch_json(f"{SD_PARCELS_URL}?{params}", timeout=120).get("features", [])
+            if not page:
+                break
+            features.extend(page)
+            offset += len(page)
+            print(f"  [{zip_code}] {offset:,} parcels")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    parcels = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    parcels.to_file(path, driver="GPKG")
+    print(f"Saved {len(parcels):,} parcels -> {path}")
+
+
+class LocalParcels:
+    """Parcel layer loaded from disk, queried through its spatial index."""
+
+    def __init__(self, path=LOCAL_PARCELS_FILE):
+        import geopandas as gpd
+
+        if not os.path.exists(path):
+            print(f"Local parcels not found, downloading to {path}...")
+            download_local_parcels(path)
+        self.parcels = gpd.read_file(path)
+        self.attrs = self.parcels.drop(columns="geometry")
+        self.sindex = self.parcels.sindex
+        # Situs tokens per row position, so matching never re-splits addresses
+        self.tokens = [parcel_tokens(rec) for rec in self.attrs.to_dict("records")]
+        print(f"Loaded {len(self.parcels):,} local parcels from {path}")
+
+    def query(self, lat, lon, buf=0.0003):
+        """Same envelope as query_parcel_features, shaped like the ArcGIS features."""
+        hits = sorted(self.sindex.intersection((lon - buf, lat - buf, lon + buf, lat + buf)))
+        rows = self.attrs.iloc[hits]
+        return [
+            {"attributes": {k: (None if v != v else v) for k, v in rec.items()},
+             "tokens": self.tokens[i]}
+            for i, rec in zip(hits, rows.to_dict("records"))
+        ]
+
+
+# Set by --local-parcels; find_parcel falls back to the ArcGIS API when None
+LOCAL_PARCELS = None
+
+
+def find_parcel(lat, lon, input_address=""):
     try:
-        data = fetch_json(url)
+        if LOCAL_PARCELS is not None:
+            features = LOCAL_PARCELS.query(lat, lon)
+        else:
+            features = query_parcel_features(lat, lon)
     except Exception as e:
         print(f"  Parcel query error: {e}", file=sys.stderr)
         return None
 
-    features = data.get("features", [])
     if not features:
         return None
 
     if len(features) == 1 or not input_address:
         return {k: v for k, v in features[0]["attributes"].items() if v is not None}
 
-    scored = []
-    for feat in features:
-        attrs = feat["attributes"]
-        s = score_address_match(attrs, input_address)
-        scored.append((s, attrs))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return {k: v for k, v in scored[0][1].items() if v is not None}
+    input_parts = address_tokens(input_address)
+    best = max(
+        features,
+        key=lambda feat: score_address_match(
+            feat.get("tokens") or parcel_tokens(feat["attributes"]), input_parts),
+    )
+    return {k: v for k, v in best["attributes"].items() if v is not None}
 
 
 def lookup_single(address, api_key, verbose=True):
@@ -216,30 +356,38 @@ def enrich_listings(input_path, output_path=None, dry_run=False, limit=None):
 
     print(f"\nProcessing {len(process_rows)} San Diego listings...")
 
-    for i, row in enumerate(process_rows):
-        address = row.get("address", "")
-        if not address:
-            for c in PARCEL_COLS:
-                row[c] = ""
-            failed += 1
-            continue
-
-        print(f"[{i+1}/{len(process_rows)}] {address[:60]}...")
-
-        result = lookup_single(address, api_key, verbose=False)
-
-        if result and result.get("parcel_apn"):
-            for k, v in result.items():
-                row[k] = v if v is not None else ""
-            matched += 1
-            print(f"  -> APN: {result['parcel_apn']}")
-        else:
-            for c in PARCEL_COLS:
-                row[c] = ""
-            failed += 1
-            print(f"  -> no match")
-
-        time.sleep(0.1)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for i, row in enumerate(process_rows):
+            address = row.get("address", "")
+            if not address:
+                for c in PARCEL_COLS:
+                    row[c] = ""
+                failed += 1
+                continue
+
+            futures[executor.submit(lookup_single, address, api_key, False)] = (i, row, address)
+
+        for future in as_completed(futures):
+            i, row, address = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"  Lookup error: {e}", file=sys.stderr)
+                result = None
+
+            print(f"[{i+1}/{len(process_rows)}] {address[:60]}...")
+
+            if result and result.get("parcel_apn"):
+                for k, v in result.items():
+                    row[k] = v if v is not None else ""
+                matched += 1
+                print(f"  -> APN: {result['parcel_apn']}")
+            else:
+                for c in PARCEL_COLS:
+                    row[c] = ""
+                failed += 1
+                print(f"  -> no match")
 
     for row in non_sd_rows:
         for c in PARCEL_COLS:
@@ -263,8 +411,16 @@ if __name__ == "__main__":
     parser.add_argument("--output", "-o", type=str, help="Output CSV (default: input_with_parcels.csv)")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be processed")
     parser.add_argument("--limit", type=int, help="Limit number of rows to process")
+    parser.add_argument("--local-parcels", nargs="?", const=LOCAL_PARCELS_FILE, metavar="GPKG",
+                        help=f"Match against a local parcel GeoPackage instead of the ArcGIS API "
+                             f"(default: {LOCAL_PARCELS_FILE}, downloaded if missing)")
     args = parser.parse_args()
 
+    if args.local_parcels and not args.dry_run:
+        LOCAL_PARCELS = LocalParcels(args.local_parcels)
+    if args.address or (args.input and not args.dry_run):
+        CACHE = GeoCache(CACHE_FILE)
+
     if args.address:
         api_key = load_api_key()
         lookup_single(args.address, api_key)
@@ -2,7 +2,9 @@
 Pull listings from Supabase and enrich them with latitude/longitude via Google Geocoding.
 
 Fetches rows from the `listings` table (optionally only those missing coords),
-builds full address from address, city, state, zip, geocodes, and updates each row.
+reads the full_address column (address, city, state, zip; generated in Postgres
+by scripts/db/migrations/009_listings_full_address.sql), geocodes, and updates
+each row.
 
 Requires .env (repo root or scripts/ or scripts/geopoints/) with:
   SUPABASE_URL=...  (or VITE_SUPABASE_URL, same as frontend)
@@ -27,15 +29,20 @@ Usage:
 """
 
 import argparse
-import json
 import os
 import sys
-import time
-import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
+from _env import read_env
+from _geocache import CACHE_FILE, GeoCache, geocode_key
+from _google import GEOCODE_URL, GoogleClient
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
+
 # Repo root = parent of scripts/
 REPO_ROOT = Path(__file__).resolve().parent.parent.parent
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -47,20 +54,30 @@ ENV_LOCATIONS = [
     SCRIPT_DIR / ".env.local",
     SCRIPT_DIR / ".env",
 ]
-GOOGLE_GEO_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Geocodes in flight at once; the limiter keeps the total under Google's QPS cap
+GEOCODE_WORKERS = 20
+GOOGLE_REQUESTS_PER_SECOND = 40
+
+# Coordinates written back per upsert request
+UPDATE_BATCH_SIZE = 500
+
+# Listings fetched per request; PostgREST caps a single response at 1000 rows
+FETCH_PAGE_SIZE = 1000
+
+
+GOOGLE = GoogleClient(
+    "SupabaseListingsGeopoints/1.0",
+    RateLimiter(GOOGLE_REQUESTS_PER_SECOND, burst=GOOGLE_REQUESTS_PER_SECOND),
+)
 
 
 def load_env():
     """Load .env into os.environ from first existing file."""
-    for path in ENV_LOCATIONS:
-        if path.exists():
-            with open(path) as f:
-                for line in f:
-                    line = line.strip()
-                    if "=" in line and not line.startswith("#"):
-                        k, v = line.split("=", 1)
-                        os.environ[k.strip()] = v.strip().strip('"').strip("'")
-            return
+    path = next((p for p in ENV_LOCATIONS if p.exists()), None)
+    if path is None:
+        return
+    os.environ.update(read_env(path))
 
 
 def get_supabase_config():
@@ -84,52 +101,56 @@ def get_required_env(*keys):
     return [os.environ[k] for k in keys]
 
 
-def geocode_address(address: str, api_key: str):
-    params = urllib.parse.urlencode({"address": address, "key": api_key})
-    url = f"{GOOGLE_GEO_URL}?{params}"
-    req = urllib.request.Request(url, headers={"User-Agent": "SupabaseListingsGeopoints/1.0"})
+def geocode_address(address: str, api_key: str, cache: GeoCache):
+    key = geocode_key(address)
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+
+    params = {"address": address, "key": api_key}
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode())
+        data = GOOGLE.get(GEOCODE_URL, params, timeout=30)
     except Exception as e:
         print(f"  Geocode request error: {e}", file=sys.stderr)
         return None, None
+    if data.get("status") == "ZERO_RESULTS":
+        cache.set(key, [None, None])
     if data.get("status") != "OK" or not data.get("results"):
         return None, None
     loc = data["results"][0]["geometry"]["location"]
+    cache.set(key, [loc["lat"], loc["lng"]])
     return loc["lat"], loc["lng"]
 
 
-def build_full_address(row: dict) -> str:
-    parts = [
-        row.get("address"),
-        row.get("city"),
-        row.get("state"),
-        row.get("zip"),
-    ]
-    return ", ".join(p for p in parts if p and str(p).strip()).strip()
+def _flush_updates(client, pending) -> int:
+    """Write buffered coords back in one upsert. Returns rows written (0 on error)."""
+    if not pending:
+        return 0
+    try:
+        client.table("listings").upsert(pending, on_conflict="id").execute()
+    except Exception as e:
+        print(f"  -> batch update of {len(pending)} rows failed: {e}", file=sys.stderr)
+        return 0
+    return len(pending)
 
 
-def _print_results_table(client, build_full_address):
+def _print_results_table(client):
     """Fetch listings with coords and print as table."""
-    try:
-        show_response = (
+    def with_coords():
+        # Builders mutate in place, so each attempt starts from a fresh one
+        return (
             client.table("listings")
-            .select("id,address,city,state,zip,latitude,longitude")
+            .select("id,address,full_address,latitude,longitude")
             .not_.is_("latitude", "null")
-            .order("sale_date", desc=True)
-            .limit(20)
-            .execute()
+            .not_.is_("longitude", "null")
         )
+
+    try:
+        show_response = with_coords().order("sale_date", desc=True).limit(20).execute()
     except Exception:
-        show_response = (
-            client.table("listings")
-            .select("id,address,city,state,zip,latitude,longitude")
-            .order("sale_date", desc=True)
-            .limit(50)
-            .execute()
-        )
-    rows = [r for r in (show_response.data or []) if r.get("latitude") is not None and r.get("longitude") is not None]
+        # Same filter without the sale_date ordering
+        show_response = with_coords().limit(20).execute()
+    rows = show_response.data or []
     if not rows:
         print("No listings with geopoints yet.")
         return
@@ -137,7 +158,7 @@ def _print_results_table(client, build_full_address):
     print(f"\n{'Address':<{col_w}} {'Latitude':>10} {'Longitude':>11}")
     print("-" * (col_w + 10 + 11 + 2))
     for r in rows:
-        addr = (build_full_address(r) or r.get("address") or "")[: col_w - 1]
+        addr = (r.get("full_address") or r.get("address") or "")[: col_w - 1]
         lat, lon = r.get("latitude"), r.get("longitude")
         lat_s = f"{lat:.5f}" if lat is not None else ""
         lon_s = f"{lon:.5f}" if lon is not None else ""
@@ -145,6 +166,24 @@ def _print_results_table(client, build_full_address):
     print(f"\n(Showing {len(rows)} rows)")
 
 
+def iter_listings(client, missing_only: bool, limit: Optional[int] = None):
+    """Yield listings newest first, one FETCH_PAGE_SIZE page at a time."""
+    start = 0
+    while limit is None or start < limit:
+        end = start + FETCH_PAGE_SIZE - 1
+        if limit is not None:
+            end = min(end, limit - 1)
+        query = client.table("listings").select("id,address,full_address,latitude,longitude")
+        if missing_only:
+            query = query.is_("latitude", "null")
+        # id breaks sale_date ties so pages neither overlap nor skip rows
+        page = query.order("sale_date", desc=True).order("id").range(start, end).execute().data or []
+        yield from page
+        if len(page) < end - start + 1:
+            break
+        start = end + 1
+
+
 def run(supabase_url: str, supabase_key: str, api_key: str, all_listings: bool, limit: Optional[int], dry_run: bool, show_only: bool):
     try:
         from supabase import create_client
@@ -157,27 +196,16 @@ def run(supabase_url: str, supabase_key: str, api_key: str, all_listings: bool,
     if show_only:
         # Only fetch and display current state (no Google key needed)
         print("Fetching listings with geopoints from Supabase...")
-        _print_results_table(client, build_full_address)
+        _print_results_table(client)
         # Also show count missing coords
-        missing = client.table("listings").select("id").is_("latitude", "null").execute()
-        total_missing = len(missing.data or [])
+        missing = client.table("listings").select("id", count="exact", head=True).is_("latitude", "null").execute()
+        total_missing = missing.count or 0
         print(f"\nListings still missing coords: {total_missing}")
         return
 
-    if all_listings:
-        response = client.table("listings").select("id,address,city,state,zip,latitude,longitude").order("sale_date", desc=True).execute()
-    else:
-        response = (
-            client.table("listings")
-            .select("id,address,city,state,zip,latitude,longitude")
-            .is_("latitude", "null")
-            .order("sale_date", desc=True)
-            .execute()
-        )
-
-    rows = response.data or []
-    if limit is not None:
-        rows = rows[:limit]
+    # Fetched in full before any coords are written back: writes would shift
+    # later pages of the missing-coords filter out from under the offsets.
+    rows = list(iter_listings(client, missing_only=not all_listings, limit=limit))
 
     total = len(rows)
     if total == 0:
@@ -187,7 +215,7 @@ def run(supabase_url: str, supabase_key: str, api_key: str, all_listings: bool,
     print(f"Processing {total} listing(s). Dry run: {dry_run}")
     if dry_run:
         for i, r in enumerate(rows[:15]):
-            addr = build_full_address(r) or "(no address)"
+            addr = r.get("full_address") or "(no address)"
             print(f"  [{i+1}] {addr}")
         if total > 15:
             print(f"  ... and {total - 15} more")
@@ -195,37 +223,55 @@ def run(supabase_url: str, supabase_key: str, api_key: str, all_listings: bool,
 
     updated = 0
     failed = 0
-    for i, row in enumerate(rows):
-        listing_id = row.get("id")
-        full_address = build_full_address(row)
-        if not full_address:
-            print(f"[{i+1}/{total}] id={listing_id} — no address, skip")
-            failed += 1
-            continue
-
-        print(f"[{i+1}/{total}] {full_address[:60]}{'...' if len(full_address) > 60 else ''}")
-        lat, lon = geocode_address(full_address, api_key)
-        if lat is None:
-            print("  -> no result")
-            failed += 1
-        else:
-            resp = client.table("listings").update({"latitude": lat, "longitude": lon}).eq("id", listing_id).execute()
-            if getattr(resp, "error", None) is None:
-                print(f"  -> {lat}, {lon}")
-                updated += 1
-            else:
-                print(f"  -> update failed: {resp.error}")
+    pending = []  # coords not yet written back, flushed every UPDATE_BATCH_SIZE
+    addresses = [row.get("full_address") or "" for row in rows]
+    # Listings sharing an address (condos, HOA complexes) are geocoded once
+    unique = {}
+    for addr in addresses:
+        if addr:
+            unique.setdefault(geocode_key(addr), addr)
+    print(f"{len(unique)} unique address(es)")
+    # Opened only now, so --show-only and --dry-run never touch the cache file
+    cache = GeoCache(CACHE_FILE)
+
+    # Geocode concurrently; rows are walked in order and the Supabase updates
+    # stay on this thread.
+    with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as executor:
+        futures = {key: executor.submit(geocode_address, addr, api_key, cache) for key, addr in unique.items()}
+        for i, (row, full_address) in enumerate(zip(rows, addresses)):
+            listing_id = row.get("id")
+            if not full_address:
+                print(f"[{i+1}/{total}] id={listing_id} — no address, skip")
                 failed += 1
+                continue
 
-        time.sleep(0.15)
+            lat, lon = futures[geocode_key(full_address)].result()
+            print(f"[{i+1}/{total}] {full_address[:60]}{'...' if len(full_address) > 60 else ''}")
+            if lat is None:
+                print("  -> no result")
+                failed += 1
+                continue
+
+            print(f"  -> {lat}, {lon}")
+            # address rides along only to satisfy its NOT NULL on the insert
+            # side of the upsert; existing rows just get the new coords.
+            pending.append({"id": listing_id, "address": row.get("address"), "latitude": lat, "longitude": lon})
+            if len(pending) >= UPDATE_BATCH_SIZE:
+                written = _flush_updates(client, pending)
+                updated += written
+                failed += len(pending) - written
+                pending = []
+
+    written = _flush_updates(client, pending)
+    updated += written
+    failed += len(pending) - written
 
     print(f"\nDone: {updated} updated, {failed} failed.")
     print("\n--- Listings with geopoints (sample) ---")
-    _print_results_table(client, build_full_address)
+    _print_results_table(client)
 
 
 def main():
-    load_env()
     parser = argparse.ArgumentParser(description="Enrich Supabase listings with geopoints via Google Geocoding")
     parser.add_argument("--all", action="store_true", help="Process all listings (default: only missing coords)")
     parser.add_argument("--limit", type=int, help="Max number of listings to process")
@@ -233,6 +279,8 @@ def main():
     parser.add_argument("--show-only", action="store_true", help="Only fetch and show listings with geopoints (no geocoding)")
     args = parser.parse_args()
 
+    # After argparse, so --help and usage errors don't touch the env files
+    load_env()
     supabase_url, supabase_key = get_supabase_config()
     api_key = "" if args.show_only else get_required_env("GOOGLE_GEOCODING_API_KEY")[0]
 
@@ -1,84 +1,106 @@
 import csv
-import urllib.request
-import urllib.parse
-import json
-import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# The shared geopoints helpers live one directory up, and the helpers shared
+# across script directories in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+from _env import read_env
+from _geocache import CACHE_FILE, GeoCache, geocode_key
+from _google import GEOCODE_URL, GoogleClient
+from common.rate_limiter import RateLimiter
+from common.streaming import replace_on_success, stream_in_order
 
 FILE = "data/tmf/deals_rows.csv"
 ENV_FILE = ".env"
 
-def load_env(path):
-    with open(path) as f:
-        for line in f:
-            line = line.strip()
-            if "=" in line and not line.startswith("#"):
-                k, v = line.split("=", 1)
-                os.environ[k.strip()] = v.strip()
-
-load_env(ENV_FILE)
+os.environ.update(read_env(ENV_FILE))
 API_KEY = os.environ["GOOGLE_GEOCODING_API_KEY"]
 
-GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+# Geocodes in flight at once; the limiter keeps the total under Google's QPS cap
+MAX_WORKERS = 20
+REQUESTS_PER_SECOND = 40
+
+
+GOOGLE = GoogleClient("DealGeocoder/1.0", RateLimiter(REQUESTS_PER_SECOND, burst=REQUESTS_PER_SECOND))
+
 
-def geocode(full_address):
-    params = urllib.parse.urlencode({
+def geocode(full_address, cache):
+    key = geocode_key(full_address)
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+
+    params = {
         "address": full_address,
         "key": API_KEY,
-    })
-    url = f"{GEOCODE_URL}?{params}"
+    }
     try:
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = json.loads(resp.read().decode())
+        data = GOOGLE.get(GEOCODE_URL, params, timeout=15)
         if data.get("status") == "OK" and data.get("results"):
             loc = data["results"][0]["geometry"]["location"]
+            cache.set(key, [loc["lat"], loc["lng"]])
             return loc["lat"], loc["lng"]
         else:
+            if data.get("status") == "ZERO_RESULTS":
+                cache.set(key, [None, None])
             print(f"  status: {data.get('status')} | {data.get('error_message', '')}", file=sys.stderr)
     except Exception as e:
         print(f"  ERROR: {e}", file=sys.stderr)
     return None, None
 
-with open(FILE, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    fieldnames = reader.fieldnames
-    rows = list(reader)
 
-total = len(rows)
-matched_before = sum(1 for r in rows if r.get("latitude"))
-print(f"Starting: {matched_before}/{total} already have coords\n")
+# Bounded number of rows waiting on a geocode, so the file is never fully in memory
+WINDOW = MAX_WORKERS * 4
 
+total = 0
+matched_before = 0
 newly_matched = 0
-total_geocoded = 0
 
-for row in rows:
-    fa = row["full_address"]
 
-    if row.get("latitude"):
-        total_geocoded += 1
-        continue
+def write_result(writer, row, future):
+    """Apply one finished geocode to its row and stream it to the output."""
+    global total, newly_matched
+    total += 1
+    if future is not None:
+        lat, lon = future.result()
 
-    print(f"[{row['id']}] {fa}")
-    lat, lon = geocode(fa)
-    time.sleep(0.05)
+        print(f"[{row['id']}] {row['full_address']}")
+        if lat:
+            row["latitude"] = lat
+            row["longitude"] = lon
+            newly_matched += 1
+            print(f"  -> {lat}, {lon}")
+        else:
+            print(f"  -> NO MATCH")
+    writer.writerow(row)
 
-    if lat:
-        row["latitude"] = lat
-        row["longitude"] = lon
-        newly_matched += 1
-        total_geocoded += 1
-        print(f"  -> {lat}, {lon}")
-    else:
-        print(f"  -> NO MATCH")
 
-print(f"\nGoogle pass: {newly_matched} new matches")
-print(f"Total with coords: {total_geocoded}/{total}")
+cache = GeoCache(CACHE_FILE)
 
-with open(FILE, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
+# Rows are written to a temp file in input order as soon as their geocode (if
+# any) is done, then swapped in (after FILE is closed); an interrupted run
+# leaves FILE untouched.
+with replace_on_success(FILE) as fout, \
+        open(FILE, newline="", encoding="utf-8") as fin:
+    reader = csv.DictReader(fin)
+    writer = csv.DictWriter(fout, fieldnames=reader.fieldnames)
     writer.writeheader()
-    writer.writerows(rows)
 
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        def submit(row):
+            global matched_before
+            if row.get("latitude"):
+                matched_before += 1
+                return None
+            return executor.submit(geocode, row["full_address"], cache)
+
+        stream_in_order(reader, submit, lambda row, future: write_result(writer, row, future), WINDOW)
+
+print(f"\nAlready had coords: {matched_before}/{total}")
+print(f"Google pass: {newly_matched} new matches")
+print(f"Total with coords: {matched_before + newly_matched}/{total}")
 print(f"Updated {FILE}")
@@ -16,12 +16,21 @@ Usage:
 """
 
 import csv
-import json
-import os
+import random
 import sys
-import time
-import urllib.request
-import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
+from common.streaming import replace_on_success, stream_in_order
 
 # --- Config ---
 
@@ -41,6 +50,46 @@ GOOGLE_GEO_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 
 SD_COUNTY_FIPS = "06073"
 
+# Attributes read by resolve / batch_enrich / score_address_match; the layer
+# has ~80, so asking for these alone keeps parcel responses small
+PARCEL_FIELDS = [
+    "APN", "OWN_NAME1",
+    "ASR_TOTAL", "ASR_LAND", "ASR_IMPR",
+    "TOTAL_LVG_AREA", "USABLE_SQ_FEET", "BEDROOMS", "BATHS",
+    "SITUS_ADDRESS", "SITUS_PRE_DIR", "SITUS_STREET", "SITUS_SUFFIX",
+    "SITUS_COMMUNITY", "SITUS_ZIP",
+]
+
+# Parcel batch queries in flight at once in --batch; every request still goes
+# through the limiter for its host
+MAX_WORKERS = 8
+GOOGLE_REQUESTS_PER_SECOND = 40
+ARCGIS_REQUESTS_PER_SECOND = 10
+CENSUS_REQUESTS_PER_SECOND = 10
+
+# One keep-alive session for the Google, ArcGIS and Census hosts, retrying
+# throttled/transient errors
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "SDParcelLookup/1.0"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=None),  # incl. the POSTed (read-only) parcel batch query
+))
+
+# Throttling reported in a 200 body (Google OVER_QUERY_LIMIT, ArcGIS error
+# codes) is retried by fetch_json; HTTP 429/5xx are retried by the adapter,
+# which honours Retry-After.
+THROTTLE_RETRIES = 3
+BACKOFF_BASE = 0.5
+
+
+GOOGLE_LIMITER = RateLimiter(GOOGLE_REQUESTS_PER_SECOND, burst=GOOGLE_REQUESTS_PER_SECOND)
+ARCGIS_LIMITER = RateLimiter(ARCGIS_REQUESTS_PER_SECOND)
+CENSUS_LIMITER = RateLimiter(CENSUS_REQUESTS_PER_SECOND)
+
 
 def load_api_key():
     with open(ENV_FILE) as f:
@@ -50,17 +99,33 @@ def load_api_key():
     raise RuntimeError("GOOGLE_GEOCODING_API_KEY not found in .env")
 
 
-def fetch_json(url, timeout=15):
-    req = urllib.request.Request(url)
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode())
+def is_throttled(body):
+    return body.get("status") == "OVER_QUERY_LIMIT" or (body.get("error") or {}).get("code") in (429, 503)
+
+
+def fetch_json(url, limiter, params=None, data=None, timeout=15):
+    """GET url (or POST the form `data`, for queries too long for a URL).
+
+    A throttled response pauses the host's limiter with jittered exponential
+    backoff, so all workers ease off, then the request is retried.
+    """
+    for attempt in range(THROTTLE_RETRIES + 1):
+        limiter.wait()
+        if data is not None:
+            resp = SESSION.post(url, data=data, timeout=timeout)
+        else:
+            resp = SESSION.get(url, params=params, timeout=timeout)
+        resp.raise_for_status()
+        body = orjson.loads(resp.content)
+        if attempt == THROTTLE_RETRIES or not is_throttled(body):
+            return body
+        limiter.pause(BACKOFF_BASE * 2 ** attempt + random.uniform(0, BACKOFF_BASE))
 
 
 # --- Geocode (fallback for address-only input) ---
 
 def geocode_address(address, api_key):
-    params = urllib.parse.urlencode({"address": address, "key": api_key})
-    data = fetch_json(f"{GOOGLE_GEO_URL}?{params}")
+    data = fetch_json(GOOGLE_GEO_URL, GOOGLE_LIMITER, params={"address": address, "key": api_key})
     if data.get("status") != "OK" or not data.get("results"):
         return None, None
     loc = data["results"][0]["geometry"]["location"]
@@ -69,75 +134,195 @@ def geocode_address(address, api_key):
 
 # --- Parcel lookup (spatial query with buffer + address ranking) ---
 
-def score_address_match(parcel_attrs, input_address):
-    input_upper = input_address.upper()
-    input_parts = set(input_upper.replace(",", " ").split())
+def address_tokens(address):
+    """Upper-cased words of an input address, for score_address_match."""
+    return frozenset(address.upper().replace(",", " ").split())
 
+
+def score_address_match(parcel_attrs, input_parts):
     situs_num = str(parcel_attrs.get("SITUS_ADDRESS", "")).strip()
     situs_street = (parcel_attrs.get("SITUS_STREET") or "").strip().upper()
     situs_suffix = (parcel_attrs.get("SITUS_SUFFIX") or "").strip().upper()
 
-    score = 0
+    score = 5 * len(frozenset(situs_street.split()) & input_parts)
     if situs_num and situs_num in input_parts:
         score += 10
-    for word in situs_street.split():
-        if word in input_parts:
-            score += 5
     if situs_suffix and situs_suffix in input_parts:
         score += 2
     return score
 
 
+# Half-width in degrees of the box a parcel must intersect to match a point
+PARCEL_BUFFER_DEG = 0.0003
+
+# --batch sends this many deals per ArcGIS query. The query asks for parcels
+# within PARCEL_BATCH_RADIUS_M of any point (just over the half-diagonal of
+# the PARCEL_BUFFER_DEG box), then each deal keeps those hitting its own box.
+PARCEL_BATCH_SIZE = 100
+PARCEL_BATCH_RADIUS_M = 45
+
+
+def parcel_envelope(lat, lon):
+    buf = PARCEL_BUFFER_DEG
+    return lon - buf, lat - buf, lon + buf, lat + buf
+
+
+def pick_parcel(candidates, input_address=""):
+    """Best candidate's attributes (None-valued fields dropped), by address match."""
+    if not candidates:
+        return None
+    best = candidates[0]
+    if len(candidates) > 1 and input_address:
+        input_parts = address_tokens(input_address)
+        best = max(candidates, key=lambda attrs: score_address_match(attrs, input_parts))
+    return {k: v for k, v in best.items() if v is not None}
+
+
 def find_parcel(lat, lon, input_address=""):
-    buf = 0.0003
-    envelope = f"{lon - buf},{lat - buf},{lon + buf},{lat + buf}"
-    url = (
-        f"{SD_PARCELS_URL}"
-        f"?geometry={envelope}"
-        f"&geometryType=esriGeometryEnvelope"
-        f"&inSR=4326"
-        f"&spatialRel=esriSpatialRelIntersects"
-        f"&outFields=*"
-        f"&returnGeometry=false"
-        f"&f=json"
-    )
+    params = {
+        "geometry": ",".join(map(str, parcel_envelope(lat, lon))),
+        "geometryType": "esriGeometryEnvelope",
+        "inSR": 4326,
+        "spatialRel": "esriSpatialRelIntersects",
+        "outFields": ",".join(PARCEL_FIELDS),
+        "returnGeometry": "false",
+        "f": "json",
+    }
     try:
-        data = fetch_json(url)
+        data = fetch_json(SD_PARCELS_URL, ARCGIS_LIMITER, params=params)
     except Exception as e:
         print(f"  Parcel query error: {e}", file=sys.stderr)
         return None
 
-    features = data.get("features", [])
-    if not features:
-        return None
-
-    if len(features) == 1 or not input_address:
-        return {k: v for k, v in features[0]["attributes"].items() if v is not None}
+    return pick_parcel([feat["attributes"] for feat in data.get("features", [])], input_address)
 
-    scored = []
-    for feat in features:
-        attrs = feat["attributes"]
-        s = score_address_match(attrs, input_address)
-        scored.append((s, attrs))
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return {k: v for k, v in scored[0][1].items() if v is not None}
+def _segment_hits_box(x1, y1, x2, y2, box):
+    """Liang-Barsky: does the segment cross or touch the box?"""
+    xmin, ymin, xmax, ymax = box
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x1 - xmin), (dx, xmax - x1), (-dy, y1 - ymin), (dy, ymax - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+def _point_in_rings(x, y, rings):
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+def _rings_hit_box(rings, box):
+    """Does a polygon intersect the box (an edge crosses it, or it contains the box)?"""
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            if _segment_hits_box(x1, y1, x2, y2, box):
+                return True
+    return _point_in_rings((box[0] + box[2]) / 2, (box[1] + box[3]) / 2, rings)
+
+
+def find_parcels(points):
+    """find_parcel for a list of (lat, lon, address) with a single ArcGIS query."""
+    geometry = {
+        "points": [[lon, lat] for lat, lon, _ in points],
+        "spatialReference": {"wkid": 4326},
+    }
+    form = {
+        "geometry": orjson.dumps(geometry).decode(),
+        "geometryType": "esriGeometryMultipoint",
+        "inSR": 4326,
+        "outSR": 4326,
+        "spatialRel": "esriSpatialRelIntersects",
+        "distance": PARCEL_BATCH_RADIUS_M,
+        "units": "esriSRUnit_Meter",
+        "outFields": ",".join(PARCEL_FIELDS),
+        "returnGeometry": "true",
+        "geometryPrecision": 6,
+        "f": "json",
+    }
+    try:
+        data = fetch_json(SD_PARCELS_URL, ARCGIS_LIMITER, data=form, timeout=60)
+    except Exception as e:
+        print(f"  Parcel batch query error: {e}", file=sys.stderr)
+        data = None
+    if data is None or "error" in data or data.get("exceededTransferLimit"):
+        # Refused or truncated; fall back to one query per point
+        return [find_parcel(lat, lon, input_address=address) for lat, lon, address in points]
+
+    # (bounding box, rings, attributes) per returned parcel, in server order
+    parcels = []
+    for feat in data.get("features", []):
+        rings = (feat.get("geometry") or {}).get("rings") or []
+        xs = [x for ring in rings for x, _ in ring]
+        ys = [y for ring in rings for _, y in ring]
+        if xs:
+            parcels.append(((min(xs), min(ys), max(xs), max(ys)), rings, feat["attributes"]))
+
+    results = []
+    for lat, lon, address in points:
+        box = parcel_envelope(lat, lon)
+        candidates = [
+            attrs for (pxmin, pymin, pxmax, pymax), rings, attrs in parcels
+            if pxmin <= box[2] and pxmax >= box[0] and pymin <= box[3] and pymax >= box[1]
+            and _rings_hit_box(rings, box)
+        ]
+        results.append(pick_parcel(candidates, address))
+    return results
+
+
+def _find_parcels_into(points, futures):
+    """Run find_parcels and hand each point's result to its own future."""
+    try:
+        results = find_parcels(points)
+    except Exception as e:
+        for future in futures:
+            future.set_exception(e)
+        return
+    for future, result in zip(futures, results):
+        future.set_result(result)
 
 
 # --- Census hierarchy ---
 
+# Census lookups are cached by coordinates rounded to this many decimals
+# (4 ~ 10 m). Deals in the same building or lot share one API call, while
+# points are still far finer than tract boundaries.
+CENSUS_CACHE_DECIMALS = 4
+
+
 def get_census_hierarchy(lat, lon):
-    params = urllib.parse.urlencode({
-        "x": lon, "y": lat,
-        "benchmark": "Public_AR_Current",
-        "vintage": "Current_Current",
-        "format": "json",
-    })
     try:
-        data = fetch_json(f"{CENSUS_GEO_URL}?{params}")
+        hierarchy = _census_lookup(round(lat, CENSUS_CACHE_DECIMALS), round(lon, CENSUS_CACHE_DECIMALS))
     except Exception as e:
         print(f"  Census query error: {e}", file=sys.stderr)
         return {}
+    return dict(hierarchy)
+
+
+@lru_cache(maxsize=50000)
+def _census_lookup(lat, lon):
+    """Uncached-on-error census query; failures raise so they are retried next time."""
+    params = {
+        "x": lon, "y": lat,
+        "benchmark": "Public_AR_Current",
+        "vintage": "Current_Current",
+        "format": "json",
+    }
+    data = fetch_json(CENSUS_GEO_URL, CENSUS_LIMITER, params=params)
 
     geos = data.get("result", {}).get("geographies", {})
     state = (geos.get("States") or [{}])[0]
@@ -161,7 +346,12 @@ def get_census_hierarchy(lat, lon):
 # --- Single address/coordinate lookup ---
 
 def resolve(lat, lon, address="", verbose=True):
-    parcel = find_parcel(lat, lon, input_address=address)
+    # The parcel and census lookups are independent; run them side by side
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        census = executor.submit(get_census_hierarchy, lat, lon)
+        parcel = find_parcel(lat, lon, input_address=address)
+        hierarchy = census.result()
+
     if verbose and parcel:
         situs = " ".join(filter(None, [
             str(parcel.get("SITUS_ADDRESS", "")),
@@ -175,7 +365,6 @@ def resolve(lat, lon, address="", verbose=True):
     elif verbose:
         print("  No parcel found")
 
-    hierarchy = get_census_hierarchy(lat, lon)
     if verbose and hierarchy:
         print(f"  Census:  {hierarchy.get('census_place_name', '?')} / {hierarchy.get('census_county_name', '?')} / {hierarchy.get('census_state_name', '?')}")
         print(f"  Tract:   {hierarchy.get('census_tract_geoid', '?')}")
@@ -185,74 +374,102 @@ def resolve(lat, lon, address="", verbose=True):
 
 # --- Batch: enrich deals_rows.csv ---
 
-PARCEL_OUTPUT_COLS = [
-    "parcel_apn", "parcel_owner", "parcel_assessed_total",
-    "parcel_assessed_land", "parcel_assessed_impr",
-    "parcel_sqft_living", "parcel_sqft_lot", "parcel_beds", "parcel_baths",
-    "parcel_community", "parcel_zip",
-]
+# Deal column <- parcel attribute, copied as-is; parcel_zip is trimmed separately
+PARCEL_FIELD_MAP = (
+    ("parcel_apn", "APN"),
+    ("parcel_owner", "OWN_NAME1"),
+    ("parcel_assessed_total", "ASR_TOTAL"),
+    ("parcel_assessed_land", "ASR_LAND"),
+    ("parcel_assessed_impr", "ASR_IMPR"),
+    ("parcel_sqft_living", "TOTAL_LVG_AREA"),
+    ("parcel_sqft_lot", "USABLE_SQ_FEET"),
+    ("parcel_beds", "BEDROOMS"),
+    ("parcel_baths", "BATHS"),
+    ("parcel_community", "SITUS_COMMUNITY"),
+)
 
+PARCEL_OUTPUT_COLS = [dk for dk, _ in PARCEL_FIELD_MAP] + ["parcel_zip"]
 
-def batch_enrich():
-    with open(DEALS_FILE, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        old_fields = reader.fieldnames
-        deals = list(reader)
 
-    new_fields = old_fields + [c for c in PARCEL_OUTPUT_COLS if c not in old_fields]
+# Bounded number of deals waiting on a lookup in --batch, so the file is never
+# fully in memory
+WINDOW = PARCEL_BATCH_SIZE * MAX_WORKERS * 2
 
-    total = len(deals)
-    matched = 0
-    skipped = 0
 
-    for i, deal in enumerate(deals):
-        lat = deal.get("latitude", "").strip()
-        lon = deal.get("longitude", "").strip()
-        county = deal.get("county_geoid", "").strip()
+def write_deal(writer, i, deal, future, stats):
+    """Apply one finished lookup to its deal and stream it to the output."""
+    if future is None:
+        stats["skipped"] += 1
+        for c in PARCEL_OUTPUT_COLS:
+            deal[c] = ""
+        writer.writerow(deal)
+        return
 
-        if not lat or not lon:
-            skipped += 1
-            for c in PARCEL_OUTPUT_COLS:
-                deal[c] = ""
-            continue
+    result = future.result() or {}
+    print(f"[{i+1}] {deal.get('display_name', deal.get('address', '?'))}")
 
-        if county and county != SD_COUNTY_FIPS:
-            skipped += 1
-            for c in PARCEL_OUTPUT_COLS:
-                deal[c] = ""
-            continue
-
-        print(f"[{i+1}/{total}] {deal.get('display_name', deal.get('address', '?'))}")
-        result = resolve(float(lat), float(lon), address=deal.get("address", ""), verbose=False)
-
-        if result.get("APN"):
-            deal["parcel_apn"] = result.get("APN", "")
-            deal["parcel_owner"] = result.get("OWN_NAME1", "")
-            deal["parcel_assessed_total"] = result.get("ASR_TOTAL", "")
-            deal["parcel_assessed_land"] = result.get("ASR_LAND", "")
-            deal["parcel_assessed_impr"] = result.get("ASR_IMPR", "")
-            deal["parcel_sqft_living"] = result.get("TOTAL_LVG_AREA", "")
-            deal["parcel_sqft_lot"] = result.get("USABLE_SQ_FEET", "")
-            deal["parcel_beds"] = result.get("BEDROOMS", "")
-            deal["parcel_baths"] = result.get("BATHS", "")
-            deal["parcel_community"] = result.get("SITUS_COMMUNITY", "")
-            deal["parcel_zip"] = (result.get("SITUS_ZIP") or "").strip()[:5]
-            matched += 1
-            print(f"  -> APN {deal['parcel_apn']}  Owner: {deal['parcel_owner']}")
-        else:
-            for c in PARCEL_OUTPUT_COLS:
-                deal[c] = ""
-            print(f"  -> no parcel")
+    if result.get("APN"):
+        for dk, rk in PARCEL_FIELD_MAP:
+            deal[dk] = result.get(rk, "")
+        deal["parcel_zip"] = (result.get("SITUS_ZIP") or "").strip()[:5]
+        stats["matched"] += 1
+        print(f"  -> APN {deal['parcel_apn']}  Owner: {deal['parcel_owner']}")
+    else:
+        for c in PARCEL_OUTPUT_COLS:
+            deal[c] = ""
+        print(f"  -> no parcel")
+    writer.writerow(deal)
 
-        time.sleep(0.3)
 
+def batch_enrich():
     output_path = DEALS_FILE.replace(".csv", "_with_parcels.csv")
-    with open(output_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=new_fields, extrasaction="ignore")
+    stats = {"matched": 0, "skipped": 0}
+
+    # Deals are resolved concurrently and streamed to a temp file in input
+    # order, then swapped in; an interrupted run leaves the old output intact.
+    with replace_on_success(output_path) as fout, \
+            open(DEALS_FILE, newline="", encoding="utf-8") as fin:
+        reader = csv.DictReader(fin)
+        old_fields = reader.fieldnames
+        new_fields = old_fields + [c for c in PARCEL_OUTPUT_COLS if c not in old_fields]
+        writer = csv.DictWriter(fout, fieldnames=new_fields, extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(deals)
 
-    print(f"\nDone: {matched} parcel matches, {skipped} skipped (non-SD or no coords)")
+        # Deals waiting to fill the next PARCEL_BATCH_SIZE query
+        batch, batch_futures = [], []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            def submit_batch():
+                if batch:
+                    executor.submit(_find_parcels_into, list(batch), list(batch_futures))
+                    batch.clear()
+                    batch_futures.clear()
+
+            def submit(item):
+                _, deal = item
+                lat = deal.get("latitude", "").strip()
+                lon = deal.get("longitude", "").strip()
+                county = deal.get("county_geoid", "").strip()
+                if not lat or not lon or (county and county != SD_COUNTY_FIPS):
+                    return None
+
+                future = Future()
+                batch.append((float(lat), float(lon), deal.get("address", "")))
+                batch_futures.append(future)
+                if len(batch) >= PARCEL_BATCH_SIZE:
+                    submit_batch()
+                return future
+
+            # The oldest deal may be waiting on the unsent batch, so it is
+            # flushed before blocking
+            stream_in_order(
+                enumerate(reader),
+                submit,
+                lambda item, future: write_deal(writer, *item, future, stats),
+                WINDOW,
+                flush=submit_batch,
+            )
+
+    print(f"\nDone: {stats['matched']} parcel matches, {stats['skipped']} skipped (non-SD or no coords)")
     print(f"Output: {output_path}")
 
 
@@ -16,26 +16,111 @@ Schedule with cron (e.g., every day at 7am):
 Output:
     data/listings/daily/new_listings_YYYY-MM-DD.csv  - New listings for outreach
     data/listings/daily/all_listings_YYYY-MM-DD.csv  - Full snapshot for diffing
+    data/listings/daily/all_listings_YYYY-MM-DD.jsonl - Same snapshot as JSON Lines,
+                                                        read by extract_clean_demo.py
 """
 
 import argparse
 import csv
 import os
+import pickle
 import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timedelta
+from operator import itemgetter
 from pathlib import Path
 
+import orjson
+
 # Add parent to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
-from scrape_current_listings import fetch_redfin_search, fetch_listing_details, ListingRecord, TARGET_ZIPS
+from scrape_current_listings import fetch_redfin_search, fetch_listing_details, reset_session, ListingRecord, TARGET_ZIPS
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
+from common.sqlite_cache import SQLiteCache
 
 import time
-from dataclasses import asdict
 
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data" / "listings" / "daily"
 DRE_FILE = PROJECT_ROOT / "data" / "ca-dre" / "CurrList.csv"
+# Scraped listing pages by Redfin URL, reused by re-runs within --cache-hours
+LISTING_CACHE_FILE = DATA_DIR / "listing_cache.sqlite"
+# Parsed DRE lookup, reused until CurrList.csv is replaced (or its layout changes)
+DRE_CACHE_FILE = DRE_FILE.with_suffix(".pkl")
+
+# CurrList.csv columns read by build_dre_fields; the other ~20 are never kept
+DRE_COLUMNS = [
+    "firstname_secondary", "lastname_primary",
+    "lic_type", "lic_status", "lic_expiration_date",
+    "address_1", "city", "zip_code",
+    "related_firstname_secondary", "related_lastname_primary", "related_lic_number",
+]
+# Low-cardinality DRE_COLUMNS, interned so ~400k licensees share one string
+# per distinct value (the pickle cache keeps the sharing, as pickle memoizes)
+DRE_INTERNED_COLUMNS = ["lic_type", "lic_status", "lic_expiration_date", "city", "zip_code"]
+# Read buffer for the ~100 MB CurrList.csv (default is 8 KiB)
+DRE_READ_BUFFER = 1 << 20
+
+# Column order of the new-listings CSV handed to outreach
+OUTREACH_COLUMNS = [
+    "address", "city", "zipcode", "price", "listing_date",
+    "beds", "baths", "sqft", "property_type", "year_built",
+    "agent_full_name", "agent_dre", "agent_phone", "agent_license_type",
+    "brokerage", "supervising_broker_name", "supervising_broker_dre",
+    "agent_business_address", "agent_business_city", "agent_business_zip",
+    "mls_number", "days_on_market", "redfin_url",
+]
+
+# Worker processes fetching and parsing listing pages. Parsing and the regex
+# field extraction are CPU work, so processes (not threads) let them use
+# several cores; requests are still submitted at most one per --delay seconds.
+# Each worker starts with its own Redfin session rather than any connection
+# inherited from this process
+FETCH_WORKERS = 4
+
+# A cached listing page is reused for this long (--cache-hours). Kept under the
+# daily cron interval so each run's snapshot re-fetches every page; the cache
+# only spares re-runs on the same day
+LISTING_CACHE_HOURS = 20
+
+
+def build_dre_fields(dre_info: dict) -> dict:
+    """The listing fields enrich_with_dre adds for one DRE licensee.
+
+    Built once per licensee when the DRE file is loaded (and pickled with it),
+    so enriching a listing is a single dict lookup and update.
+    """
+    fields = {
+        "agent_full_name": f"{dre_info.get('firstname_secondary', '')} {dre_info.get('lastname_primary', '')}".strip(),
+        "agent_license_type": dre_info.get("lic_type", ""),
+        "agent_license_status": dre_info.get("lic_status", ""),
+        "agent_license_expires": dre_info.get("lic_expiration_date", ""),
+        "agent_business_address": dre_info.get("address_1", ""),
+        "agent_business_city": dre_info.get("city", ""),
+        "agent_business_zip": dre_info.get("zip_code", ""),
+    }
+    
+    # If salesperson, get broker info
+    if dre_info.get("lic_type") == "Salesperson":
+        fields["supervising_broker_name"] = f"{dre_info.get('related_firstname_secondary', '')} {dre_info.get('related_lastname_primary', '')}".strip()
+        fields["supervising_broker_dre"] = dre_info.get("related_lic_number", "")
+    else:
+        fields["supervising_broker_name"] = ""
+        fields["supervising_broker_dre"] = ""
+    
+    return fields
+
+
+# Fields for listings whose agent isn't in the DRE file
+EMPTY_DRE_FIELDS = build_dre_fields({})
+
+# Pickled with the lookup; a cache built for other columns/fields is ignored
+DRE_CACHE_KEY = (tuple(DRE_COLUMNS), tuple(EMPTY_DRE_FIELDS))
 
 
 def load_dre_database() -> dict:
@@ -47,15 +132,60 @@ def load_dre_database() -> dict:
         print(f"  Warning: DRE file not found at {DRE_FILE}", file=sys.stderr)
         return dre_lookup
     
-    with open(DRE_FILE, encoding="latin-1") as f:
-        for row in csv.DictReader(f):
-            lic_num = row.get("lic_number", "").lstrip("0")
-            dre_lookup[lic_num] = row
+    cached = load_dre_cache()
+    if cached is not None:
+        print(f"  Loaded {len(cached):,} licensees from {DRE_CACHE_FILE.name}", file=sys.stderr)
+        return cached
+    
+    with open(DRE_FILE, encoding="latin-1", newline="", buffering=DRE_READ_BUFFER) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if "lic_number" not in header:
+            print(f"  Warning: no lic_number column in {DRE_FILE.name}", file=sys.stderr)
+            return dre_lookup
+        # lic_number plus the DRE_COLUMNS present, pulled out of each row by
+        # one C-level itemgetter call
+        names = ["lic_number"] + [name for name in DRE_COLUMNS if name in header]
+        pick = itemgetter(*(header.index(name) for name in names))
+        interned = [header.index(name) for name in names if name in DRE_INTERNED_COLUMNS]
+        width = len(header)
+        
+        for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            for i in interned:
+                row[i] = sys.intern(row[i])
+            dre_info = dict(zip(names, pick(row)))
+            dre_lookup[dre_info["lic_number"].lstrip("0")] = build_dre_fields(dre_info)
     
     print(f"  Loaded {len(dre_lookup):,} licensees", file=sys.stderr)
+    save_dre_cache(dre_lookup)
     return dre_lookup
 
 
+def load_dre_cache():
+    """Return the pickled DRE lookup if it is newer than CurrList.csv, else None."""
+    try:
+        if DRE_CACHE_FILE.stat().st_mtime < DRE_FILE.stat().st_mtime:
+            return None
+        with open(DRE_CACHE_FILE, "rb") as f:
+            key, dre_lookup = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    return dre_lookup if key == DRE_CACHE_KEY else None
+
+
+def save_dre_cache(dre_lookup: dict):
+    """Pickle the DRE lookup next to CurrList.csv (best effort)."""
+    tmp_path = DRE_CACHE_FILE.with_suffix(".pkl.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((DRE_CACHE_KEY, dre_lookup), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, DRE_CACHE_FILE)
+    except OSError as e:
+        print(f"  Warning: could not write {DRE_CACHE_FILE.name}: {e}", file=sys.stderr)
+
+
 def load_previous_listings(date: datetime) -> set:
     """Load identifiers from previous day's snapshot to identify new listings.
     
@@ -71,12 +201,17 @@ def load_previous_listings(date: datetime) -> set:
     print(f"  Loading previous listings from {prev_file.name}...", file=sys.stderr)
     identifiers = set()
     
-    with open(prev_file, encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+    with open(prev_file, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        # Only the two identifier columns are read from each row
+        mls_idx = header.index("mls_number") if "mls_number" in header else None
+        url_idx = header.index("redfin_url") if "redfin_url" in header else None
+        
         for row in reader:
             # Use MLS number if available, otherwise use Redfin URL
-            mls = row.get("mls_number", "").strip()
-            url = row.get("redfin_url", "").strip()
+            mls = row[mls_idx].strip() if mls_idx is not None and mls_idx < len(row) else ""
+            url = row[url_idx].strip() if url_idx is not None and url_idx < len(row) else ""
             
             if mls:
                 identifiers.add(f"mls:{mls}")
@@ -90,56 +225,119 @@ def load_previous_listings(date: datetime) -> set:
 def enrich_with_dre(listing: dict, dre_lookup: dict) -> dict:
     """Add full DRE info to a listing record."""
     dre_num = listing.get("agent_dre", "").lstrip("0")
-    dre_info = dre_lookup.get(dre_num, {})
-    
-    # Add enriched fields
-    listing["agent_full_name"] = f"{dre_info.get('firstname_secondary', '')} {dre_info.get('lastname_primary', '')}".strip()
-    listing["agent_license_type"] = dre_info.get("lic_type", "")
-    listing["agent_license_status"] = dre_info.get("lic_status", "")
-    listing["agent_license_expires"] = dre_info.get("lic_expiration_date", "")
-    listing["agent_business_address"] = dre_info.get("address_1", "")
-    listing["agent_business_city"] = dre_info.get("city", "")
-    listing["agent_business_zip"] = dre_info.get("zip_code", "")
-    
-    # If salesperson, get broker info
-    if dre_info.get("lic_type") == "Salesperson":
-        listing["supervising_broker_name"] = f"{dre_info.get('related_firstname_secondary', '')} {dre_info.get('related_lastname_primary', '')}".strip()
-        listing["supervising_broker_dre"] = dre_info.get("related_lic_number", "")
-    else:
-        listing["supervising_broker_name"] = ""
-        listing["supervising_broker_dre"] = ""
-    
+    listing.update(dre_lookup.get(dre_num, EMPTY_DRE_FIELDS))
     return listing
 
 
-def scrape_all_zips(delay: float = 2.0) -> list[dict]:
-    """Scrape all target zip codes and return listing records."""
-    all_listings = []
+def scrape_all_zips(delay: float = 2.0, cache_hours: float = LISTING_CACHE_HOURS):
+    """Scrape all target zip codes, yielding listing records as they arrive.
+
+    Listing pages fetched less than cache_hours ago are taken from the
+    listing cache instead of Redfin (cache_hours=0 always fetches).
+    """
+    # Paces submissions from this process only; the worker processes just
+    # fetch what they are handed
+    limiter = RateLimiter(1 / delay) if delay > 0 else None
+    cache = SQLiteCache(LISTING_CACHE_FILE, "listing_pages", cache_hours * 3600) if cache_hours > 0 else None
+    cache_hits = 0
     
     print(f"\nScraping {len(TARGET_ZIPS)} zip codes...", file=sys.stderr)
     
-    for zip_idx, zipcode in enumerate(TARGET_ZIPS, 1):
-        print(f"\n[{zip_idx}/{len(TARGET_ZIPS)}] Zip code {zipcode}", file=sys.stderr)
-        
-        listing_urls = fetch_redfin_search(zipcode)
-        
-        for i, url in enumerate(listing_urls, 1):
-            print(f"    [{i}/{len(listing_urls)}] Fetching...", file=sys.stderr, end="\r")
-            record = fetch_listing_details(url)
-            if record:
-                all_listings.append(asdict(record))
-            time.sleep(delay)
-        
-        print(f"    Scraped {len(listing_urls)} listings from {zipcode}", file=sys.stderr)
-        
-        # Longer delay between zip codes
-        if zip_idx < len(TARGET_ZIPS):
-            time.sleep(3)
+    with ProcessPoolExecutor(max_workers=FETCH_WORKERS, initializer=reset_session) as executor:
+        for zip_idx, zipcode in enumerate(TARGET_ZIPS, 1):
+            print(f"\n[{zip_idx}/{len(TARGET_ZIPS)}] Zip code {zipcode}", file=sys.stderr)
+            
+            listing_urls = fetch_redfin_search(zipcode)
+            
+            # Detail pages are submitted here at the limiter's pace and
+            # fetched/parsed in the workers; finished records are handed
+            # back in URL order while later pages are still being submitted
+            pending = deque()
+            urls = iter(listing_urls)
+            fetched = 0
+            while True:
+                url = next(urls, None)
+                if url is not None:
+                    listing = cache.get(url) if cache else None
+                    if listing is not None:
+                        # Queued as a finished future to keep URL order
+                        future = Future()
+                        future.set_result(listing)
+                        cache_hits += 1
+                    else:
+                        if limiter:
+                            limiter.wait()
+                        future = executor.submit(fetch_listing_details, url)
+                    pending.append((url, future, listing is not None))
+                
+                # Once every URL is submitted, wait for the rest
+                while pending and (url is None or pending[0][1].done()):
+                    page_url, future, cached = pending.popleft()
+                    record = future.result()
+                    fetched += 1
+                    print(f"    [{fetched}/{len(listing_urls)}] Fetching...", file=sys.stderr, end="\r")
+                    if cached:
+                        record["scraped_at"] = datetime.now().isoformat()
+                        yield record
+                    elif record:
+                        # Flat record of strings, built fresh per page, so its
+                        # __dict__ can be kept as-is (asdict deep-copies)
+                        listing = vars(record)
+                        if cache:
+                            cache.set(page_url, listing)
+                        yield listing
+                
+                if url is None:
+                    break
+            
+            print(f"    Scraped {len(listing_urls)} listings from {zipcode}", file=sys.stderr)
+            
+            # Longer delay between zip codes
+            if zip_idx < len(TARGET_ZIPS):
+                time.sleep(3)
     
-    return all_listings
+    if cache:
+        print(f"\n  {cache_hits} listing pages reused from {LISTING_CACHE_FILE.name}", file=sys.stderr)
+
+
+def snapshot_jsonl(csv_path: Path) -> Path | None:
+    """Return the .jsonl twin of a snapshot CSV if it is at least as new."""
+    jsonl_path = csv_path.with_suffix(".jsonl")
+    try:
+        if jsonl_path.stat().st_mtime >= csv_path.stat().st_mtime:
+            return jsonl_path
+    except OSError:
+        pass
+    return None
+
+
+def read_snapshot(csv_path: Path):
+    """Yield the rows of a snapshot, from its JSON Lines twin when current."""
+    jsonl_path = snapshot_jsonl(csv_path)
+    print(f"\nSkipping scrape, loading existing {(jsonl_path or csv_path).name}...", file=sys.stderr)
+    if jsonl_path:
+        with open(jsonl_path, "rb") as f:
+            for line in f:
+                yield orjson.loads(line)
+    else:
+        with open(csv_path, encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
+def is_new_listing(listing: dict, previous_mls: set) -> bool:
+    """True if neither the MLS number nor the URL was in yesterday's data."""
+    mls = listing.get("mls_number", "").strip()
+    url = listing.get("redfin_url", "").strip()
+    
+    if mls and f"mls:{mls}" in previous_mls:
+        return False
+    if url and f"url:{url}" in previous_mls:
+        return False
+    return True
 
 
-def run_pipeline(dry_run: bool = False, skip_scrape: bool = False, delay: float = 2.0):
+def run_pipeline(dry_run: bool = False, skip_scrape: bool = False, delay: float = 2.0,
+                 cache_hours: float = LISTING_CACHE_HOURS):
     """Run the full daily pipeline."""
     today = datetime.now()
     date_str = today.strftime("%Y-%m-%d")
@@ -165,81 +363,64 @@ def run_pipeline(dry_run: bool = False, skip_scrape: bool = False, delay: float
     
     # Scrape or load existing
     all_file = DATA_DIR / f"all_listings_{date_str}.csv"
+    jsonl_file = all_file.with_suffix(".jsonl")
+    new_file = DATA_DIR / f"new_listings_{date_str}.csv"
     
     if skip_scrape and all_file.exists():
-        print(f"\nSkipping scrape, loading existing {all_file.name}...", file=sys.stderr)
-        with open(all_file, encoding="utf-8") as f:
-            all_listings = list(csv.DictReader(f))
+        listings = read_snapshot(all_file)
     else:
-        all_listings = scrape_all_zips(delay=delay)
-    
-    print(f"\n{'='*60}", file=sys.stderr)
-    print(f"PROCESSING {len(all_listings)} LISTINGS", file=sys.stderr)
-    print(f"{'='*60}", file=sys.stderr)
-    
-    # Identify new listings (check both MLS number and URL)
-    new_listings = []
-    for listing in all_listings:
-        mls = listing.get("mls_number", "").strip()
-        url = listing.get("redfin_url", "").strip()
-        
-        is_new = True
-        if mls and f"mls:{mls}" in previous_mls:
-            is_new = False
-        if url and f"url:{url}" in previous_mls:
-            is_new = False
+        listings = scrape_all_zips(delay=delay, cache_hours=cache_hours)
+    
+    # Each listing is enriched with DRE data and written out as it arrives:
+    # to the full snapshot (CSV + JSON Lines, for tomorrow's diff) and, if
+    # new, to the outreach file. Only the new listings stay in memory. The
+    # snapshot goes to .tmp files swapped in at the end, so --skip-scrape can
+    # read the snapshot it is rewriting.
+    tmp_all = all_file.with_suffix(".csv.tmp")
+    tmp_jsonl = jsonl_file.with_suffix(".jsonl.tmp")
+    total = 0
+    enriched_new = []
+    
+    with (
+        open(tmp_all, "w", newline="", encoding="utf-8") as all_f,
+        open(tmp_jsonl, "wb") as jsonl_f,
+        open(new_file, "w", newline="", encoding="utf-8") as new_f,
+    ):
+        all_writer = csv.writer(all_f)
+        new_writer = csv.writer(new_f)
+        # Outreach-friendly column order; header-only when nothing is new
+        new_writer.writerow(OUTREACH_COLUMNS)
+        fieldnames = None
         
-        if is_new:
-            new_listings.append(listing)
-    
-    print(f"  New listings (not in yesterday's data): {len(new_listings)}", file=sys.stderr)
-    
-    # Enrich all listings with DRE data
-    print(f"  Enriching with DRE data...", file=sys.stderr)
-    enriched_all = [enrich_with_dre(l, dre_lookup) for l in all_listings]
-    enriched_new = [enrich_with_dre(l, dre_lookup) for l in new_listings]
-    
-    # Write full snapshot (for tomorrow's diff)
-    print(f"\nWriting {len(enriched_all)} listings to {all_file.name}...", file=sys.stderr)
-    if enriched_all:
-        with open(all_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=enriched_all[0].keys())
-            writer.writeheader()
-            writer.writerows(enriched_all)
+        for listing in listings:
+            enrich_with_dre(listing, dre_lookup)
+            if fieldnames is None:
+                fieldnames = list(listing)
+                all_writer.writerow(fieldnames)
+            all_writer.writerow([listing.get(k, "") for k in fieldnames])
+            jsonl_f.write(orjson.dumps(listing, option=orjson.OPT_APPEND_NEWLINE))
+            total += 1
+            
+            if is_new_listing(listing, previous_mls):
+                new_writer.writerow([listing.get(k, "") for k in OUTREACH_COLUMNS])
+                enriched_new.append(listing)
     
-    # Write new listings (for outreach)
-    new_file = DATA_DIR / f"new_listings_{date_str}.csv"
-    print(f"Writing {len(enriched_new)} NEW listings to {new_file.name}...", file=sys.stderr)
-    if enriched_new:
-        # Reorder columns for outreach-friendly format
-        outreach_columns = [
-            "address", "city", "zipcode", "price", "listing_date",
-            "beds", "baths", "sqft", "property_type", "year_built",
-            "agent_full_name", "agent_dre", "agent_phone", "agent_license_type",
-            "brokerage", "supervising_broker_name", "supervising_broker_dre",
-            "agent_business_address", "agent_business_city", "agent_business_zip",
-            "mls_number", "days_on_market", "redfin_url",
-        ]
-        
-        with open(new_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=outreach_columns, extrasaction="ignore")
-            writer.writeheader()
-            writer.writerows(enriched_new)
+    if total:
+        os.replace(tmp_all, all_file)
+        os.replace(tmp_jsonl, jsonl_file)
     else:
-        # Write empty file with headers
-        with open(new_file, "w", newline="", encoding="utf-8") as f:
-            f.write("address,city,zipcode,price,listing_date,beds,baths,sqft,property_type,year_built,"
-                   "agent_full_name,agent_dre,agent_phone,agent_license_type,brokerage,"
-                   "supervising_broker_name,supervising_broker_dre,"
-                   "agent_business_address,agent_business_city,agent_business_zip,"
-                   "mls_number,days_on_market,redfin_url\n")
+        tmp_all.unlink()
+        tmp_jsonl.unlink()
+    
+    print(f"\nWrote {total} listings to {all_file.name}", file=sys.stderr)
+    print(f"Wrote {len(enriched_new)} NEW listings to {new_file.name}", file=sys.stderr)
     
     # Print summary
     print(f"\n{'='*60}", file=sys.stderr)
     print(f"SUMMARY", file=sys.stderr)
     print(f"{'='*60}", file=sys.stderr)
-    print(f"  Total listings scraped: {len(all_listings)}", file=sys.stderr)
-    print(f"  New listings today:     {len(new_listings)}", file=sys.stderr)
+    print(f"  Total listings scraped: {total}", file=sys.stderr)
+    print(f"  New listings today:     {len(enriched_new)}", file=sys.stderr)
     print(f"  With DRE match:         {sum(1 for l in enriched_new if l.get('agent_full_name'))}", file=sys.stderr)
     print(f"\n  Output files:", file=sys.stderr)
     print(f"    {all_file}", file=sys.stderr)
@@ -269,13 +450,20 @@ def main():
         default=2.0,
         help="Delay between requests in seconds (default: 2.0)"
     )
+    parser.add_argument(
+        "--cache-hours",
+        type=float,
+        default=LISTING_CACHE_HOURS,
+        help=f"Reuse listing pages scraped within this many hours; 0 always re-fetches (default: {LISTING_CACHE_HOURS})"
+    )
     
     args = parser.parse_args()
     
     new_listings = run_pipeline(
         dry_run=args.dry_run,
         skip_scrape=args.skip_scrape,
-        delay=args.delay
+        delay=args.delay,
+        cache_hours=args.cache_hours,
     )
     
     # Print new listings to stdout for piping
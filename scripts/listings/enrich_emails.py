@@ -18,35 +18,39 @@ from pathlib import Path
 
 
 # Known brokerage domains and their email patterns
-# Pattern tokens: {first}, {last}, {firstlast}, {first.last}, {flast}
+# Patterns are str.format templates over: {first}, {last}, {firstlast},
+# {first_last} (first.last), {flast}
 BROKERAGE_PATTERNS = {
     # Major brokerages
-    "compass": ("compass.com", "{first.last}"),
-    "berkshire hathaway": ("bhhscal.com", "{first.last}"),
-    "coldwell banker": ("cbcal.com", "{first.last}"),
-    "keller williams": ("kw.com", "{first.last}"),
-    "sotheby": ("sothebysrealty.com", "{first.last}"),
-    "pacific sotheby": ("pacificsir.com", "{first.last}"),
-    "willis allen": ("willisallen.com", "{first.last}"),
-    "douglas elliman": ("elliman.com", "{first.last}"),
-    "exp realty": ("exprealty.com", "{first.last}"),
-    "re/max": ("remax.net", "{first.last}"),
-    "century 21": ("century21.com", "{first.last}"),
-    "real broker": ("realbroker.com", "{first.last}"),
+    "compass": ("compass.com", "{first_last}"),
+    "berkshire hathaway": ("bhhscal.com", "{first_last}"),
+    "coldwell banker": ("cbcal.com", "{first_last}"),
+    "keller williams": ("kw.com", "{first_last}"),
+    "sotheby": ("sothebysrealty.com", "{first_last}"),
+    "pacific sotheby": ("pacificsir.com", "{first_last}"),
+    "willis allen": ("willisallen.com", "{first_last}"),
+    "douglas elliman": ("elliman.com", "{first_last}"),
+    "exp realty": ("exprealty.com", "{first_last}"),
+    "re/max": ("remax.net", "{first_last}"),
+    "century 21": ("century21.com", "{first_last}"),
+    "real broker": ("realbroker.com", "{first_last}"),
     "barry estates": ("barryestates.com", "{first}"),
     
     # Regional/boutique
-    "windermere": ("windermere.com", "{first.last}"),
-    "first team": ("firstteam.com", "{first.last}"),
-    "seven gables": ("sevengables.com", "{first.last}"),
+    "windermere": ("windermere.com", "{first_last}"),
+    "first team": ("firstteam.com", "{first_last}"),
+    "seven gables": ("sevengables.com", "{first_last}"),
 }
 
+_NORM_BROKERAGE = re.compile(r"[^a-z0-9\s]")
+_ALPHA_ONLY = re.compile(r"[^a-z]")
+
 
 def normalize_brokerage(brokerage: str) -> str:
     """Normalize brokerage name for matching."""
     if not brokerage:
         return ""
-    return re.sub(r'[^a-z0-9\s]', '', brokerage.lower()).strip()
+    return _NORM_BROKERAGE.sub("", brokerage.lower()).strip()
 
 
 def extract_name_parts(full_name: str) -> tuple[str, str]:
@@ -72,30 +76,36 @@ def generate_email(first: str, last: str, domain: str, pattern: str) -> str:
         return ""
     
     # Clean name parts (remove non-alpha chars)
-    first = re.sub(r'[^a-z]', '', first)
-    last = re.sub(r'[^a-z]', '', last)
+    first = _ALPHA_ONLY.sub("", first)
+    last = _ALPHA_ONLY.sub("", last)
     
     if not first:
         return ""
     
-    # Replace pattern tokens
-    email_user = pattern
-    email_user = email_user.replace("{first.last}", f"{first}.{last}" if last else first)
-    email_user = email_user.replace("{first}", first)
-    email_user = email_user.replace("{last}", last)
-    email_user = email_user.replace("{firstlast}", f"{first}{last}")
-    email_user = email_user.replace("{flast}", f"{first[0]}{last}" if last else first)
+    email_user = pattern.format_map({
+        "first": first,
+        "last": last,
+        "firstlast": f"{first}{last}",
+        "first_last": f"{first}.{last}" if last else first,
+        "flast": f"{first[0]}{last}" if last else first,
+    })
     
     return f"{email_user}@{domain}"
 
 
+# Every BROKERAGE_PATTERNS key (normalized like the names it is matched
+# against) in one alternation, longest first, so a single search finds the
+# leftmost and most specific brokerage, e.g. "pacific sotheby" over "sotheby"
+_BROKERAGE_BY_KEY = {normalize_brokerage(key): value for key, value in BROKERAGE_PATTERNS.items()}
+_BROKERAGE_RE = re.compile("|".join(
+    re.escape(key) for key in sorted(_BROKERAGE_BY_KEY, key=len, reverse=True)
+))
+
+
 def find_brokerage_match(brokerage: str) -> tuple[str, str] | None:
     """Find matching brokerage pattern."""
-    norm = normalize_brokerage(brokerage)
-    for key, (domain, pattern) in BROKERAGE_PATTERNS.items():
-        if key in norm:
-            return domain, pattern
-    return None
+    match = _BROKERAGE_RE.search(normalize_brokerage(brokerage))
+    return _BROKERAGE_BY_KEY[match.group()] if match else None
 
 
 def enrich_emails(input_path: Path, output_path: Path = None) -> dict:
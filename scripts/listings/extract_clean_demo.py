@@ -18,6 +18,10 @@ import csv
 import re
 from pathlib import Path
 from collections import defaultdict
+from contextlib import ExitStack
+from functools import lru_cache
+
+import orjson
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = PROJECT_ROOT / "data" / "listings" / "daily"
@@ -26,6 +30,50 @@ OUTPUT_DIR = PROJECT_ROOT / "data" / "listings" / "demo"
 # Redfin corporate DRE - skip these
 REDFIN_CORPORATE_DRE = "01521930"
 
+# Email domains that make an agent/email name mismatch acceptable
+KNOWN_BROKERAGES = ["compass", "remax", "coldwellbanker", "kw", "century21",
+                    "sothebys", "berkshire", "elliman", "exp", "realty"]
+_KNOWN_BROKERAGE_RE = re.compile("|".join(map(re.escape, KNOWN_BROKERAGES)))
+
+# Buckets produced by normalize_status
+STATUSES = ["active", "pending", "sold", "other", "unknown"]
+
+
+@lru_cache(maxsize=None)
+def email_matches_agent(agent: str, email: str) -> bool:
+    """
+    Confidence check: does the agent name relate to the email (or is the
+    email at a known brokerage)?
+
+    Cached on (agent, email): the same agent/email pair recurs across an
+    agent's listings and across every daily snapshot, so each distinct pair
+    is checked once.
+    """
+    # Extract name parts for matching
+    agent_parts = agent.lower().replace("'", "").replace("-", "").split()
+    email_prefix = email.partition("@")[0].lower()
+    
+    # Check if any part of agent name appears in email
+    name_in_email = any(part in email_prefix for part in agent_parts if len(part) > 2)
+    
+    # Also check reverse - common email patterns
+    # e.g., "jsmith" for "John Smith", "john.smith", etc.
+    first_initial = agent_parts[0][0] if agent_parts else ""
+    last_name = agent_parts[-1] if len(agent_parts) > 1 else ""
+    
+    email_matches_pattern = (
+        name_in_email or
+        f"{first_initial}{last_name}" in email_prefix or
+        email_prefix.startswith(agent_parts[0][:3]) if agent_parts else False
+    )
+    
+    if email_matches_pattern:
+        return True
+    
+    # Still allow if email looks professional (has @ known brokerage)
+    domain = email.split("@")[1].lower() if "@" in email else ""
+    return _KNOWN_BROKERAGE_RE.search(domain) is not None
+
 
 def is_clean_listing(row: dict) -> tuple[bool, str]:
     """
@@ -53,37 +101,48 @@ def is_clean_listing(row: dict) -> tuple[bool, str]:
         return False, "no_email"
     
     # Confidence check: agent name should relate to email
-    # Extract name parts for matching
-    agent_parts = agent.lower().replace("'", "").replace("-", "").split()
-    email_prefix = email.split("@")[0].lower()
-    
-    # Check if any part of agent name appears in email
-    name_in_email = any(part in email_prefix for part in agent_parts if len(part) > 2)
-    
-    # Also check reverse - common email patterns
-    # e.g., "jsmith" for "John Smith", "john.smith", etc.
-    first_initial = agent_parts[0][0] if agent_parts else ""
-    last_name = agent_parts[-1] if len(agent_parts) > 1 else ""
-    
-    email_matches_pattern = (
-        name_in_email or
-        f"{first_initial}{last_name}" in email_prefix or
-        email_prefix.startswith(agent_parts[0][:3]) if agent_parts else False
-    )
-    
-    if not email_matches_pattern:
-        # Still allow if email looks professional (has @ known brokerage)
-        known_brokerages = ["compass", "remax", "coldwellbanker", "kw", "century21", 
-                           "sothebys", "berkshire", "elliman", "exp", "realty"]
-        domain = email.split("@")[1].lower() if "@" in email else ""
-        is_professional = any(b in domain for b in known_brokerages)
-        
-        if not is_professional:
-            return False, "email_name_mismatch"
+    if not email_matches_agent(agent, email):
+        return False, "email_name_mismatch"
     
     return True, "clean"
 
 
+@lru_cache(maxsize=None)
+def normalize_status(listing_status: str) -> str:
+    """Bucket a raw listing_status into active/pending/sold/other/unknown.
+
+    Cached: Redfin uses a handful of distinct status strings, so each one
+    is classified once rather than once per row.
+    """
+    status = listing_status.lower()
+    if "sold" in status or "closed" in status:
+        return "sold"
+    if "pending" in status or "under contract" in status:
+        return "pending"
+    if "active" in status or "for sale" in status:
+        return "active"
+    if not status:
+        return "unknown"
+    return "other"
+
+
+def read_listings(csv_file: Path):
+    """Yield the rows of a listings CSV.
+
+    daily_pipeline.py also writes each snapshot as JSON Lines; when that
+    twin is at least as new as the CSV it is read instead, as orjson parses
+    it much faster than csv.DictReader.
+    """
+    jsonl_file = csv_file.with_suffix(".jsonl")
+    if jsonl_file.exists() and jsonl_file.stat().st_mtime >= csv_file.stat().st_mtime:
+        with open(jsonl_file, "rb") as f:
+            for line in f:
+                yield orjson.loads(line)
+    else:
+        with open(csv_file, encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
 def extract_clean_demo(
     limit_per_status: int = 100,
     status_filter: str = None
@@ -91,6 +150,12 @@ def extract_clean_demo(
     """
     Extract clean demo listings from all CSV files.
     Returns stats about the extraction.
+
+    Rows are streamed: each source CSV is read once and clean rows are
+    written straight to their demo_<status>.csv, so only counters and the
+    open output files are held in memory. Reading stops as soon as every
+    requested status has limit_per_status rows, so the stats only cover
+    the rows read up to that point.
     """
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
@@ -109,81 +174,63 @@ def extract_clean_demo(
         print(f"No CSV files found in {DATA_DIR}")
         return stats
     
-    # Collect all listings
-    all_listings = []
-    for csv_file in csv_files:
-        print(f"Reading {csv_file.name}...")
-        with open(csv_file, encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row["_source_file"] = csv_file.name
-                all_listings.append(row)
-    
-    print(f"Total listings loaded: {len(all_listings)}")
-    
-    # Group by status
-    by_status = defaultdict(list)
-    for row in all_listings:
-        status = row.get("listing_status", "").lower()
-        source_file = row.get("_source_file", "")
-        
-        # Normalize status
-        # If from recently_sold.csv, it's a sold listing
-        if "sold" in source_file.lower():
-            status = "sold"
-        elif "sold" in status or "closed" in status:
-            status = "sold"
-        elif "pending" in status or "under contract" in status:
-            status = "pending"
-        elif "active" in status or "for sale" in status:
-            status = "active"
-        elif not status:
-            status = "unknown"
-        else:
-            status = "other"
-        by_status[status].append(row)
-    
-    print(f"By status: {dict((k, len(v)) for k, v in by_status.items())}")
-    
-    # Filter and extract clean listings
-    clean_listings = defaultdict(list)
-    
-    for status, listings in by_status.items():
-        if status_filter and status != status_filter:
-            continue
-        
-        for row in listings:
-            stats["total_processed"] += 1
-            
-            is_clean, reason = is_clean_listing(row)
-            
-            if is_clean:
-                if len(clean_listings[status]) < limit_per_status:
-                    clean_listings[status].append(row)
-                    stats["clean_found"] += 1
-                    stats["by_status"][status] += 1
-            else:
-                stats["rejection_reasons"][reason] += 1
-    
-    # Write clean listings to output files
-    for status, listings in clean_listings.items():
-        if not listings:
-            continue
-        
-        output_file = OUTPUT_DIR / f"demo_{status}.csv"
-        
-        # Get fieldnames from first row, excluding internal fields
-        fieldnames = [k for k in listings[0].keys() if not k.startswith("_")]
-        
-        with open(output_file, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for row in listings:
-                # Remove internal fields
-                clean_row = {k: v for k, v in row.items() if not k.startswith("_")}
-                writer.writerow(clean_row)
-        
-        print(f"Wrote {len(listings)} {status} listings to {output_file.name}")
+    seen_status = defaultdict(int)
+    writers = {}
+    target_statuses = {status_filter} if status_filter else set(STATUSES)
+    full_statuses = set()
+    
+    with ExitStack() as stack:
+        for csv_file in csv_files:
+            if full_statuses >= target_statuses:
+                break
+            print(f"Reading {csv_file.name}...")
+            # If from recently_sold.csv, every row is a sold listing
+            sold_file = "sold" in csv_file.name.lower()
+            for row in read_listings(csv_file):
+                status = "sold" if sold_file else normalize_status(row.get("listing_status", ""))
+                seen_status[status] += 1
+                
+                if status_filter and status != status_filter:
+                    continue
+                
+                stats["total_processed"] += 1
+                
+                is_clean, reason = is_clean_listing(row)
+                
+                if not is_clean:
+                    stats["rejection_reasons"][reason] += 1
+                    continue
+                
+                if stats["by_status"][status] >= limit_per_status:
+                    continue
+                
+                writer = writers.get(status)
+                if writer is None:
+                    # Columns come from the first row written for this status
+                    # (minus the None key DictReader uses for extra values)
+                    out = stack.enter_context(open(
+                        OUTPUT_DIR / f"demo_{status}.csv", "w", newline="", encoding="utf-8"
+                    ))
+                    fieldnames = [k for k in row if k is not None]
+                    writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction="ignore")
+                    writer.writeheader()
+                    writers[status] = writer
+                
+                writer.writerow(row)
+                stats["clean_found"] += 1
+                stats["by_status"][status] += 1
+                
+                if stats["by_status"][status] >= limit_per_status:
+                    full_statuses.add(status)
+                    if full_statuses >= target_statuses:
+                        break
+    
+    print(f"Total listings read: {sum(seen_status.values())}")
+    print(f"By status: {dict(seen_status)}")
+    
+    for status, count in stats["by_status"].items():
+        if count:
+            print(f"Wrote {count} {status} listings to demo_{status}.csv")
     
     return stats
 
@@ -196,7 +243,7 @@ def main():
     )
     parser.add_argument(
         "--status", type=str, default=None,
-        choices=["active", "pending", "sold", "other", "unknown"],
+        choices=STATUSES,
         help="Only extract listings with this status"
     )
     args = parser.parse_args()
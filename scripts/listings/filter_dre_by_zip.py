@@ -18,7 +18,8 @@ Data source:
 """
 
 import csv
-from collections import defaultdict
+from collections import Counter
+from operator import itemgetter
 from pathlib import Path
 
 # Project paths
@@ -27,9 +28,10 @@ DRE_DATA = PROJECT_ROOT / "data" / "ca-dre"
 INPUT_FILE = DRE_DATA / "CurrList.csv"
 OUTPUT_ALL = DRE_DATA / "target_licensees.csv"
 OUTPUT_BROKERS = DRE_DATA / "brokers_by_zip.csv"
+BROKER_FIELDS = ["name", "dre_number", "address", "city", "zip", "county", "status", "expires"]
 
-# Target zip codes (San Diego + Orange County only)
-TARGET_ZIPS = {
+# Target zip codes (San Diego + Orange County only), as 5-digit strings
+TARGET_ZIPS = frozenset({
     # San Diego Coastal/North
     "92037",  # La Jolla
     "92014",  # Del Mar
@@ -57,87 +59,103 @@ TARGET_ZIPS = {
     "92662",  # Balboa Peninsula
     "92648",  # Huntington Beach
     "92649",  # Huntington Beach (west)
-}
-
-
-def normalize_zip(zip_code: str) -> str:
-    """Normalize zip code to 5 digits."""
-    if not zip_code:
-        return ""
-    # Handle ZIP+4 format (93420-1234)
-    return zip_code.strip()[:5]
+})
 
 
 def main():
     print(f"Reading {INPUT_FILE}...")
+    print(f"Writing target licensees to {OUTPUT_ALL}...")
     
-    all_licensees = []
-    brokers_by_zip = defaultdict(list)
-    stats = defaultdict(int)
+    broker_rows = []
+    by_type = Counter()
+    by_zip = Counter()
+    total = 0
     
-    with open(INPUT_FILE, newline="", encoding="latin-1") as f:
-        reader = csv.DictReader(f)
+    # Matching rows are written as they are read; only brokers are kept
+    with open(INPUT_FILE, newline="", encoding="latin-1") as f, \
+         open(OUTPUT_ALL, "w", newline="", encoding="utf-8") as out:
+        # Rows are parsed as plain lists and the zip is checked by position
+        # first, so the >99% of rows outside the target zips cost nothing
+        # more; broker columns are read by index too
+        reader = csv.reader(f)
+        header = next(reader, [])
+        width = len(header)
+        # Missing columns point one past the (padded) row and read as ""
+        zip_idx = header.index("zip_code") if "zip_code" in header else width
+        type_idx = header.index("lic_type") if "lic_type" in header else width
+        columns = {name: i for i, name in enumerate(header)}
+        fn_idx = columns.get("firstname_secondary", width)
+        ln_idx = columns.get("lastname_primary", width)
+        lic_idx = columns.get("lic_number", width)
+        addr_idx = columns.get("address_1", width)
+        city_idx = columns.get("city", width)
+        county_idx = columns.get("county_name", width)
+        status_idx = columns.get("lic_status", width)
+        exp_idx = columns.get("lic_expiration_date", width)
+        writer = csv.writer(out)
+        writer.writerow(header)
         
-        for row in reader:
-            zip_code = normalize_zip(row.get("zip_code", ""))
-            
+        for fields in reader:
+            # Handle ZIP+4 format (93420-1234). Trailing whitespace can't
+            # affect the first 5 characters, so only a zip with leading
+            # whitespace needs the .strip() allocation
+            raw_zip = fields[zip_idx] if zip_idx < len(fields) else ""
+            zip_code = raw_zip[:5]
             if zip_code not in TARGET_ZIPS:
-                continue
+                if not raw_zip[:1].isspace():
+                    continue
+                zip_code = raw_zip.strip()[:5]
+                if zip_code not in TARGET_ZIPS:
+                    continue
             
-            lic_type = row.get("lic_type", "")
-            stats[lic_type] += 1
-            stats["total"] += 1
-            stats[f"zip_{zip_code}"] += 1
+            if len(fields) <= width:
+                fields += [""] * (width + 1 - len(fields))
+            lic_type = fields[type_idx]
+            by_type[lic_type] += 1
+            by_zip[zip_code] += 1
+            total += 1
             
-            all_licensees.append(row)
+            writer.writerow(fields[:width])
             
             # Track brokers separately (they're the decision makers)
             if lic_type == "Broker":
-                brokers_by_zip[zip_code].append({
-                    "name": f"{row.get('firstname_secondary', '')} {row.get('lastname_primary', '')}".strip(),
-                    "dre_number": row.get("lic_number", ""),
-                    "address": row.get("address_1", ""),
-                    "city": row.get("city", ""),
-                    "zip": zip_code,
-                    "county": row.get("county_name", ""),
-                    "status": row.get("lic_status", ""),
-                    "expires": row.get("lic_expiration_date", ""),
-                })
+                first, last = fields[fn_idx], fields[ln_idx]
+                # In BROKER_FIELDS order
+                broker_rows.append((
+                    (first + " " + last).strip() if first or last else "",
+                    fields[lic_idx],
+                    fields[addr_idx],
+                    fields[city_idx],
+                    zip_code,
+                    fields[county_idx],
+                    fields[status_idx],
+                    fields[exp_idx],
+                ))
     
-    # Write all filtered licensees
-    print(f"\nWriting {len(all_licensees)} licensees to {OUTPUT_ALL}...")
-    with open(OUTPUT_ALL, "w", newline="", encoding="utf-8") as f:
-        if all_licensees:
-            writer = csv.DictWriter(f, fieldnames=all_licensees[0].keys())
-            writer.writeheader()
-            writer.writerows(all_licensees)
+    print(f"\nWrote {total} licensees to {OUTPUT_ALL}")
     
-    # Write brokers summary
-    broker_rows = []
-    for zip_code in sorted(brokers_by_zip.keys()):
-        broker_rows.extend(brokers_by_zip[zip_code])
+    # Write brokers summary, grouped by zip (the sort is stable, so file
+    # order is kept within each zip)
+    broker_rows.sort(key=itemgetter(4))
     
     print(f"Writing {len(broker_rows)} brokers to {OUTPUT_BROKERS}...")
     with open(OUTPUT_BROKERS, "w", newline="", encoding="utf-8") as f:
-        if broker_rows:
-            writer = csv.DictWriter(f, fieldnames=broker_rows[0].keys())
-            writer.writeheader()
-            writer.writerows(broker_rows)
+        writer = csv.writer(f)
+        writer.writerow(BROKER_FIELDS)
+        writer.writerows(broker_rows)
     
     # Print summary
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total licensees in target zips: {stats['total']:,}")
-    print(f"  - Brokers: {stats.get('Broker', 0):,}")
-    print(f"  - Salespersons: {stats.get('Salesperson', 0):,}")
-    print(f"  - Corporations: {stats.get('Corporation', 0):,}")
+    print(f"Total licensees in target zips: {total:,}")
+    print(f"  - Brokers: {by_type['Broker']:,}")
+    print(f"  - Salespersons: {by_type['Salesperson']:,}")
+    print(f"  - Corporations: {by_type['Corporation']:,}")
     
     print("\nBy zip code:")
-    for zip_code in sorted(TARGET_ZIPS):
-        count = stats.get(f"zip_{zip_code}", 0)
-        if count > 0:
-            print(f"  {zip_code}: {count:,} licensees")
+    for zip_code, count in sorted(by_zip.items()):
+        print(f"  {zip_code}: {count:,} licensees")
     
     print("\n" + "=" * 60)
     print(f"Output files:")
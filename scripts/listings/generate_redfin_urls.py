@@ -9,6 +9,8 @@ This outputs URLs you can open in your browser to create saved searches.
 Set each one to "Daily" email alerts.
 """
 
+import sys
+
 TARGET_ZIPS = {
     "San Diego Coastal/North": [
         92037,  # La Jolla
@@ -54,39 +56,43 @@ def generate_zillow_url(zipcode: int) -> str:
 
 
 def main():
-    print("=" * 70)
-    print("REDFIN SAVED SEARCH URLS")
-    print("=" * 70)
-    print("\nOpen each URL, then click 'Save Search' and set to 'Daily' alerts.\n")
+    # Each URL is built once; the report is collected and written in one go
+    urls_by_zip = {z: generate_redfin_url(z) for zips in TARGET_ZIPS.values() for z in zips}
+    all_zips = list(urls_by_zip)
     
-    all_zips = []
+    lines = [
+        "=" * 70,
+        "REDFIN SAVED SEARCH URLS",
+        "=" * 70,
+        "\nOpen each URL, then click 'Save Search' and set to 'Daily' alerts.\n",
+    ]
     
     for region, zips in TARGET_ZIPS.items():
-        print(f"\n### {region} ({len(zips)} zips)")
-        print("-" * 50)
+        lines.append(f"\n### {region} ({len(zips)} zips)")
+        lines.append("-" * 50)
         for z in zips:
-            url = generate_redfin_url(z)
-            print(f"  {z}: {url}")
-            all_zips.append(z)
+            lines.append(f"  {z}: {urls_by_zip[z]}")
     
-    print("\n" + "=" * 70)
-    print(f"TOTAL: {len(all_zips)} zip codes to monitor")
-    print("=" * 70)
+    lines.append("\n" + "=" * 70)
+    lines.append(f"TOTAL: {len(all_zips)} zip codes to monitor")
+    lines.append("=" * 70)
     
     # Also output as a simple list for bulk opening
-    print("\n\n### BULK OPEN (copy/paste into terminal):")
-    print("# macOS:")
-    urls = [generate_redfin_url(z) for z in all_zips]
+    lines.append("\n\n### BULK OPEN (copy/paste into terminal):")
+    lines.append("# macOS:")
+    urls = list(urls_by_zip.values())
     # Print in batches of 5 to avoid overwhelming the browser
     for i in range(0, len(urls), 5):
         batch = urls[i:i+5]
-        print(f"open {' '.join(batch)}")
+        lines.append(f"open {' '.join(batch)}")
     
-    print("\n\n### ALTERNATIVE: Zillow URLs")
-    print("-" * 50)
+    lines.append("\n\n### ALTERNATIVE: Zillow URLs")
+    lines.append("-" * 50)
     for z in all_zips[:5]:
-        print(f"  {z}: {generate_zillow_url(z)}")
-    print(f"  ... and {len(all_zips) - 5} more")
+        lines.append(f"  {z}: {generate_zillow_url(z)}")
+    lines.append(f"  ... and {len(all_zips) - 5} more")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
@@ -15,8 +15,16 @@ Note: DRE license numbers are typically 8 digits, sometimes shown with leading z
 
 import argparse
 import json
+import sys
 import requests
+from pathlib import Path
+from requests.adapters import HTTPAdapter
 from typing import Optional
+from urllib3.util.retry import Retry
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.sqlite_cache import SQLiteCache
 
 
 DCA_API_BASE = "https://iservices.dca.ca.gov/api/search/v1"
@@ -24,34 +32,66 @@ DCA_API_BASE = "https://iservices.dca.ca.gov/api/search/v1"
 # DRE board codes in the DCA system
 DRE_BOARD_CODES = ["RE"]  # Real Estate
 
+# API responses are cached on disk and reused for this long (--cache-days)
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+LOOKUP_CACHE_FILE = PROJECT_ROOT / "data" / "ca-dre" / "dca_lookup_cache.sqlite"
+LOOKUP_CACHE_DAYS = 7
+
+# One keep-alive session so back-to-back lookups reuse the TLS connection,
+# retrying throttled/transient errors
+SESSION = requests.Session()
+SESSION.headers.update({"Accept-Encoding": "gzip", "User-Agent": "tmf-deals/1.0"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504]),
+))
 
-def search_by_license(license_number: str) -> dict:
+
+def search_by_license(license_number: str, cache: Optional[SQLiteCache] = None) -> dict:
     """Look up a specific DRE license number."""
     # Normalize license number (remove leading zeros, then pad to 8 digits)
     clean_num = license_number.lstrip("0")
     padded_num = clean_num.zfill(8)
     
+    key = f"license:{padded_num}"
+    result = cache.get(key) if cache else None
+    if result is not None:
+        return result
+    
     params = {
         "licenseNumber": padded_num,
         "boardCode": "RE",
     }
     
-    response = requests.get(DCA_API_BASE, params=params)
+    response = SESSION.get(DCA_API_BASE, params=params)
     response.raise_for_status()
-    return response.json()
+    result = response.json()
+    if cache:
+        cache.set(key, result)
+    return result
 
 
-def search_by_name(name: str, limit: int = 25) -> dict:
+def search_by_name(name: str, limit: int = 25, cache: Optional[SQLiteCache] = None) -> dict:
     """Search for DRE licensees by name."""
+    key = f"name:{limit}:{name}"
+    result = cache.get(key) if cache else None
+    if result is not None:
+        return result
+    
     params = {
         "name": name,
         "boardCode": "RE",
         "top": limit,
     }
     
-    response = requests.get(DCA_API_BASE, params=params)
+    response = SESSION.get(DCA_API_BASE, params=params)
     response.raise_for_status()
-    return response.json()
+    result = response.json()
+    if cache:
+        cache.set(key, result)
+    return result
 
 
 def format_license_info(record: dict) -> str:
@@ -106,19 +146,27 @@ def main():
         action="store_true",
         help="Output raw JSON"
     )
+    parser.add_argument(
+        "--cache-days",
+        type=float,
+        default=LOOKUP_CACHE_DAYS,
+        help=f"Reuse API responses cached within this many days; 0 always queries the API (default: {LOOKUP_CACHE_DAYS})"
+    )
     
     args = parser.parse_args()
     
     if not args.license and not args.name:
         parser.error("Must specify either --license or --name")
     
+    cache = SQLiteCache(LOOKUP_CACHE_FILE, "dca_responses", args.cache_days * 86400) if args.cache_days > 0 else None
+    
     try:
         if args.license:
             print(f"Looking up DRE #{args.license}...")
-            result = search_by_license(args.license)
+            result = search_by_license(args.license, cache)
         else:
             print(f"Searching for '{args.name}'...")
-            result = search_by_name(args.name, args.limit)
+            result = search_by_name(args.name, args.limit, cache)
         
         if args.json:
             print(json.dumps(result, indent=2))
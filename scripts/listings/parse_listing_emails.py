@@ -27,19 +27,60 @@ Usage:
 """
 
 import argparse
+import base64
 import csv
 import imaplib
 import email
 import os
+import quopri
 import re
 import sys
-import time
-from dataclasses import dataclass, asdict, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
 from email.header import decode_header
+from operator import attrgetter
+from pathlib import Path
 from typing import Optional
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+
+# Helpers shared across script directories live in scripts/common
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rate_limiter import RateLimiter
+
+# --fetch-brokers: listing pages fetched at once, and the overall request rate
+# shared by those workers (kept low to be nice to Redfin)
+BROKER_FETCH_WORKERS = 4
+BROKER_REQUESTS_PER_SECOND = 4
+
+
+# Listing card fields in alert emails
+# Price, beds, baths and sqft in one alternation, so card text is scanned once
+_CARD_FIELDS_RE = re.compile(
+    r'(?P<price>\$[\d,]+)'
+    r'|(?P<beds>\d+)\s*(?:bd|bed|BR)'
+    r'|(?P<baths>\d+(?:\.\d+)?)\s*(?:ba|bath)'
+    r'|(?P<sqft>[\d,]+)\s*(?:sq\s*ft|sqft)',
+    re.I,
+)
+_ZIP_RE = re.compile(r'/(\d{5})(?:/|$)')
+# Property listing URLs: a redfin.com/CA/ or /home/ link that isn't a filter or zipcode page
+_LISTING_HREF_RE = re.compile(r'^(?!.*/(?:filter|zipcode)/).*redfin\.com/(?:CA|home)/', re.S)
+
+# Listing page fields
+_TITLE_ADDR_RE = re.compile(r'^(.+?)\s*\|')
+_STATE_ZIP_RE = re.compile(r'([A-Z]{2})\s*(\d{5})')
+_LISTED_BY_RE = re.compile(r"Listed by\s+([A-Za-z\s\-']+?)(?:\s*[•·]\s*DRE\s*#?\s*(\d+))?")
+_DRE_RE = re.compile(r'DRE\s*#?\s*(\d{7,8})')
+# Known brokerages, as one alternation searched once per page
+_BROKERAGE_RE = re.compile(
+    r"(?:Coldwell Banker|Compass|Keller Williams|RE/MAX|Century 21|Sotheby's|eXp Realty|Berkshire Hathaway)[^,\n]*",
+    re.I,
+)
+_PHONE_RE = re.compile(r'(\d{3}[-.\s]?\d{3}[-.\s]?\d{4})')
+_PAGE_PRICE_RE = re.compile(r'\$[\d,]+')
 
 
 @dataclass
@@ -61,6 +102,12 @@ class ListingData:
     date_found: str = field(default_factory=lambda: datetime.now().isoformat())
 
 
+# CSV columns, and a getter returning a listing's values in that order
+# (cheaper per row than asdict, which deep-copies every field)
+LISTING_FIELDS = [f.name for f in fields(ListingData)]
+_listing_row = attrgetter(*LISTING_FIELDS)
+
+
 def connect_gmail() -> imaplib.IMAP4_SSL:
     """Connect to Gmail via IMAP."""
     email_addr = os.environ.get("GMAIL_ADDRESS")
@@ -77,36 +124,157 @@ def connect_gmail() -> imaplib.IMAP4_SSL:
     return mail
 
 
+_IMAP_TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+_IMAP_MSG_RE = re.compile(rb'^(\d+) \(')
+_IMAP_SECTION_RE = re.compile(rb'BODY\[([^\]]*)\]')
+_IMAP_UID_RE = re.compile(rb'\bUID (\d+)')
+
+
+def _imap_join(data) -> list[bytes]:
+    """Flatten an imaplib FETCH response into one bytes line per message,
+    with {n} literals turned back into quoted strings."""
+    lines, current = [], b""
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            literal = literal.replace(b"\\", b"\\\\").replace(b'"', b'\\"')
+            current += re.sub(rb"\{\d+\}$", b"", head) + b'"' + literal + b'"'
+        elif item is not None:
+            current += item
+            lines.append(current)
+            current = b""
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _imap_parse(line: bytes):
+    """Parse an IMAP parenthesized list into nested Python lists of str/None."""
+    stack = [[]]
+    for token in _IMAP_TOKEN_RE.findall(line):
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            if len(stack) > 1:
+                inner = stack.pop()
+                stack[-1].append(inner)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode("utf-8", "replace"))
+        else:
+            stack[-1].append(None if token.upper() == b"NIL" else token.decode())
+    return stack[0]
+
+
+def _find_html_part(struct, section: str = ""):
+    """Depth-first search of a BODYSTRUCTURE for the first text/html part.
+
+    Returns (section, transfer_encoding, charset) or None.
+    """
+    if struct and isinstance(struct[0], list):
+        # multipart: the child parts come first, then the subtype and extensions
+        for i, child in enumerate(struct, 1):
+            if not isinstance(child, list):
+                break
+            found = _find_html_part(child, f"{section}.{i}" if section else str(i))
+            if found:
+                return found
+        return None
+    if len(struct) > 5 and (struct[0] or "").lower() == "text" and (struct[1] or "").lower() == "html":
+        params = struct[2] or []
+        charset = next((v for k, v in zip(params[::2], params[1::2]) if (k or "").lower() == "charset"), None)
+        return section or "1", (struct[5] or "7bit").lower(), charset or "utf-8"
+    return None
+
+
+def _decode_part(body: bytes, encoding: str, charset: str) -> str:
+    """Undo a MIME part's Content-Transfer-Encoding and decode its text."""
+    if encoding == "base64":
+        body = base64.b64decode(body)
+    elif encoding == "quoted-printable":
+        body = quopri.decodestring(body)
+    try:
+        return body.decode(charset)
+    except LookupError:
+        return body.decode("utf-8", "replace")
+
+
 def fetch_redfin_emails(mail: imaplib.IMAP4_SSL, days: int = 7) -> list[tuple[str, str]]:
-    """Fetch Redfin alert emails from the last N days. Returns list of (subject, html_body)."""
+    """Fetch Redfin alert emails from the last N days. Returns list of (subject, html_body).
+
+    Only the HTML part and the Subject header are downloaded: one
+    BODYSTRUCTURE fetch locates each message's text/html section, then one
+    BODY.PEEK fetch per distinct section pulls those parts for all messages
+    (images and other parts are never transferred, and PEEK leaves the
+    messages unread). Messages are addressed by UID, which unlike sequence
+    numbers stays valid if the mailbox changes between commands.
+    """
     mail.select("inbox")
     
     since_date = (datetime.now() - timedelta(days=days)).strftime("%d-%b-%Y")
     
     # Search for emails from Redfin
     search_criteria = f'(FROM "redfin.com" SINCE {since_date})'
-    _, message_ids = mail.search(None, search_criteria)
+    _, message_uids = mail.uid("SEARCH", None, search_criteria)
+    msg_ids = message_uids[0].split()
+    if not msg_ids:
+        return []
+    
+    # Locate the HTML part of every message in one round-trip. Responses are
+    # keyed by the UID item each one carries, not by sequence number
+    _, struct_data = mail.uid("FETCH", b",".join(msg_ids), "(UID BODYSTRUCTURE)")
+    html_parts = {}
+    for line in _imap_join(struct_data):
+        match = _IMAP_MSG_RE.match(line)
+        if not match:
+            continue
+        parsed = _imap_parse(line[match.end() - 1:])
+        items = parsed[0] if parsed and isinstance(parsed[0], list) else []
+        attrs = {k: v for k, v in zip(items[::2], items[1::2]) if isinstance(k, str)}
+        if not attrs.get("UID"):
+            continue
+        part = _find_html_part(attrs["BODYSTRUCTURE"]) if attrs.get("BODYSTRUCTURE") else None
+        if part:
+            html_parts[attrs["UID"].encode()] = part
+    
+    # Fetch those parts, grouped by section number (usually just one group)
+    by_section = {}
+    for msg_id, (section, _, _) in html_parts.items():
+        by_section.setdefault(section, []).append(msg_id)
+    
+    fetched = {}
+    for section, ids in by_section.items():
+        _, msg_data = mail.uid(
+            "FETCH", b",".join(ids), f"(UID BODY.PEEK[{section}] BODY.PEEK[HEADER.FIELDS (SUBJECT)])"
+        )
+        # A message's response spans several items; its UID may be in the
+        # opening head or in the closing b' UID n)' line
+        parts = {}
+        for item in msg_data:
+            head = item[0] if isinstance(item, tuple) else item
+            if not isinstance(head, bytes):
+                continue
+            if _IMAP_MSG_RE.match(head):
+                parts = {}
+            uid_match = _IMAP_UID_RE.search(head)
+            if uid_match:
+                fetched[uid_match.group(1)] = parts
+            sections = _IMAP_SECTION_RE.findall(head)
+            if isinstance(item, tuple) and sections:
+                kind = "subject" if sections[-1].upper().startswith(b"HEADER") else "body"
+                parts[kind] = item[1]
     
     emails = []
-    for msg_id in message_ids[0].split():
-        _, msg_data = mail.fetch(msg_id, "(RFC822)")
-        email_body = msg_data[0][1]
-        msg = email.message_from_bytes(email_body)
+    for msg_id in msg_ids:
+        parts = fetched.get(msg_id, {})
+        if "body" not in parts:
+            continue
+        _, encoding, charset = html_parts[msg_id]
+        html_body = _decode_part(parts["body"], encoding, charset)
         
-        subject = decode_header(msg["subject"])[0][0]
+        subject = decode_header(email.message_from_bytes(parts.get("subject", b""))["subject"] or "")[0][0]
         if isinstance(subject, bytes):
             subject = subject.decode()
         
-        html_body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/html":
-                    html_body = part.get_payload(decode=True).decode()
-                    break
-        else:
-            if msg.get_content_type() == "text/html":
-                html_body = msg.get_payload(decode=True).decode()
-        
         if html_body:
             emails.append((subject, html_body))
     
@@ -115,19 +283,20 @@ def fetch_redfin_emails(mail: imaplib.IMAP4_SSL, days: int = 7) -> list[tuple[st
 
 def parse_redfin_email(subject: str, html: str) -> list[ListingData]:
     """Parse a Redfin alert email and extract listing data."""
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     listings = []
+    seen_urls = set()
     
     # Redfin emails typically have listing cards with links
-    # Look for property links
-    for link in soup.find_all("a", href=True):
+    # Look for property listing links; header/footer/tracking links are
+    # filtered out by the href pattern
+    for link in soup.find_all("a", href=_LISTING_HREF_RE):
         href = link["href"]
         
-        # Filter to actual property listing URLs
-        if "redfin.com/CA/" not in href and "redfin.com/home/" not in href:
-            continue
-        if "/filter/" in href or "/zipcode/" in href:
+        # Digest emails link each listing from several card elements; keep the first
+        if href in seen_urls:
             continue
+        seen_urls.add(href)
             
         listing = ListingData(url=href)
         
@@ -144,39 +313,30 @@ def parse_redfin_email(subject: str, html: str) -> list[ListingData]:
         parent = link.parent
         if parent:
             parent_text = parent.get_text(" ", strip=True)
-            price_match = re.search(r'\$[\d,]+', parent_text)
-            if price_match and not listing.price:
-                listing.price = price_match.group()
-            
-            # Look for beds/baths
-            beds_match = re.search(r'(\d+)\s*(?:bd|bed|BR)', parent_text, re.I)
-            baths_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:ba|bath)', parent_text, re.I)
-            sqft_match = re.search(r'([\d,]+)\s*(?:sq\s*ft|sqft)', parent_text, re.I)
+            # First match of each field wins
+            found = {}
+            for match in _CARD_FIELDS_RE.finditer(parent_text):
+                found.setdefault(match.lastgroup, match[match.lastgroup])
+                if len(found) == 4:
+                    break
             
-            if beds_match:
-                listing.beds = beds_match.group(1)
-            if baths_match:
-                listing.baths = baths_match.group(1)
-            if sqft_match:
-                listing.sqft = sqft_match.group(1).replace(",", "")
+            if "price" in found and not listing.price:
+                listing.price = found["price"]
+            if "beds" in found:
+                listing.beds = found["beds"]
+            if "baths" in found:
+                listing.baths = found["baths"]
+            if "sqft" in found:
+                listing.sqft = found["sqft"].replace(",", "")
         
         # Extract zipcode from URL if possible
-        zip_match = re.search(r'/(\d{5})(?:/|$)', href)
+        zip_match = _ZIP_RE.search(href)
         if zip_match:
             listing.zipcode = zip_match.group(1)
         
-        if listing.url:
-            listings.append(listing)
+        listings.append(listing)
     
-    # Dedupe by URL
-    seen_urls = set()
-    unique_listings = []
-    for l in listings:
-        if l.url not in seen_urls:
-            seen_urls.add(l.url)
-            unique_listings.append(l)
-    
-    return unique_listings
+    return listings
 
 
 def fetch_broker_details(listing: ListingData, session: requests.Session) -> ListingData:
@@ -188,17 +348,21 @@ def fetch_broker_details(listing: ListingData, session: requests.Session) -> Lis
         headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
         }
-        resp = session.get(listing.url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        
-        soup = BeautifulSoup(resp.text, "html.parser")
+        # A short connect timeout fails fast on unreachable hosts while the read
+        # timeout still allows slow pages. The parser reads the raw (decoded)
+        # bytes itself, so resp.text is never built; BeautifulSoup still
+        # reads the whole body into memory before parsing
+        with session.get(listing.url, headers=headers, timeout=(3, 10), stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            soup = BeautifulSoup(resp.raw, "lxml")
         
         # Extract address from page title or header
         title = soup.find("title")
         if title:
             title_text = title.get_text()
             # Redfin titles are like "123 Main St, City, CA 90210 | Redfin"
-            addr_match = re.match(r'^(.+?)\s*\|', title_text)
+            addr_match = _TITLE_ADDR_RE.match(title_text)
             if addr_match:
                 full_addr = addr_match.group(1).strip()
                 listing.address = full_addr
@@ -208,7 +372,7 @@ def fetch_broker_details(listing: ListingData, session: requests.Session) -> Lis
                 if len(parts) >= 2:
                     listing.city = parts[-2].strip() if len(parts) > 2 else ""
                     state_zip = parts[-1].strip()
-                    state_zip_match = re.match(r'([A-Z]{2})\s*(\d{5})', state_zip)
+                    state_zip_match = _STATE_ZIP_RE.match(state_zip)
                     if state_zip_match:
                         listing.state = state_zip_match.group(1)
                         listing.zipcode = state_zip_match.group(2)
@@ -218,41 +382,32 @@ def fetch_broker_details(listing: ListingData, session: requests.Session) -> Lis
         page_text = soup.get_text(" ", strip=True)
         
         # Look for "Listed by" pattern
-        listed_by_match = re.search(
-            r'Listed by\s+([A-Za-z\s\-\']+?)(?:\s*[•·]\s*DRE\s*#?\s*(\d+))?',
-            page_text
-        )
+        listed_by_match = _LISTED_BY_RE.search(page_text)
         if listed_by_match:
             listing.listing_agent = listed_by_match.group(1).strip()
             if listed_by_match.group(2):
                 listing.agent_dre = listed_by_match.group(2)
         
         # Look for DRE number
-        dre_match = re.search(r'DRE\s*#?\s*(\d{7,8})', page_text)
+        dre_match = _DRE_RE.search(page_text)
         if dre_match and not listing.agent_dre:
             listing.agent_dre = dre_match.group(1)
         
         # Look for brokerage
-        brokerage_patterns = [
-            r'(?:Coldwell Banker|Compass|Keller Williams|RE/MAX|Century 21|Sotheby\'s|eXp Realty|Berkshire Hathaway)[^,\n]*',
-        ]
-        for pattern in brokerage_patterns:
-            match = re.search(pattern, page_text, re.I)
-            if match:
-                listing.brokerage = match.group().strip()
-                break
+        brokerage_match = _BROKERAGE_RE.search(page_text)
+        if brokerage_match:
+            listing.brokerage = brokerage_match.group().strip()
         
         # Look for phone number
-        phone_match = re.search(r'(\d{3}[-.\s]?\d{3}[-.\s]?\d{4})', page_text)
+        phone_match = _PHONE_RE.search(page_text)
         if phone_match:
             listing.agent_phone = phone_match.group(1)
         
-        # Price from page
-        price_elem = soup.find(class_=re.compile(r'price|Price'))
-        if price_elem:
-            price_text = price_elem.get_text(strip=True)
-            if "$" in price_text:
-                listing.price = price_text
+        # Price from page text, if the alert email card didn't have one
+        if not listing.price:
+            price_match = _PAGE_PRICE_RE.search(page_text)
+            if price_match:
+                listing.price = price_match.group()
         
     except Exception as e:
         print(f"  Warning: Could not fetch {listing.url}: {e}", file=sys.stderr)
@@ -320,25 +475,34 @@ def main():
     if args.fetch_brokers and all_listings:
         print(f"Fetching broker details from listing pages...", file=sys.stderr)
         session = requests.Session()
-        for i, listing in enumerate(all_listings):
-            print(f"  [{i+1}/{len(all_listings)}] {listing.url[:60]}...", file=sys.stderr)
-            fetch_broker_details(listing, session)
-            time.sleep(1)  # Be nice to Redfin
+        adapter = HTTPAdapter(pool_connections=BROKER_FETCH_WORKERS, pool_maxsize=BROKER_FETCH_WORKERS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # Be nice to Redfin: requests overlap, but start at a fixed overall rate
+        limiter = RateLimiter(BROKER_REQUESTS_PER_SECOND)
+        
+        def fetch(listing):
+            limiter.wait()
+            return fetch_broker_details(listing, session)
+        
+        with ThreadPoolExecutor(max_workers=BROKER_FETCH_WORKERS) as executor:
+            futures = [executor.submit(fetch, listing) for listing in all_listings]
+            for i, future in enumerate(as_completed(futures), 1):
+                listing = future.result()
+                print(f"  [{i}/{len(all_listings)}] {listing.url[:60]}...", file=sys.stderr)
     
     # Output
     if args.output:
         with open(args.output, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=list(asdict(ListingData()).keys()))
-            writer.writeheader()
-            for listing in all_listings:
-                writer.writerow(asdict(listing))
+            writer = csv.writer(f)
+            writer.writerow(LISTING_FIELDS)
+            writer.writerows(map(_listing_row, all_listings))
         print(f"Wrote {len(all_listings)} listings to {args.output}", file=sys.stderr)
     else:
         # Print to stdout as CSV
-        writer = csv.DictWriter(sys.stdout, fieldnames=list(asdict(ListingData()).keys()))
-        writer.writeheader()
-        for listing in all_listings:
-            writer.writerow(asdict(listing))
+        writer = csv.writer(sys.stdout)
+        writer.writerow(LISTING_FIELDS)
+        writer.writerows(map(_listing_row, all_listings))
 
 
 if __name__ == "__main__":
@@ -29,10 +29,13 @@ from pathlib import Path
 from typing import Optional
 from urllib.parse import quote
 
+import lxml.etree
+import lxml.html
 import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from supabase import create_client, Client
+from urllib3.util.retry import Retry
 
 # Load .env from repo root
 _env_path = Path(__file__).resolve().parent.parent.parent / ".env"
@@ -153,6 +156,23 @@ class ListingRecord:
     scrape_instance_id: str = ""  # UUID of scrape_instances row for this run
 
 
+# Redfin pages are parsed straight into an lxml tree (they are served as UTF-8)
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+# The page's text nodes as BeautifulSoup's get_text() saw them: no script,
+# style or template contents
+PAGE_TEXT = lxml.etree.XPath(
+    "//text()[not(parent::script or parent::style or ancestor::template)]"
+)
+
+
+def parse_html(content: bytes):
+    """Parse a page into an lxml tree, or None if it is empty."""
+    try:
+        return lxml.html.document_fromstring(content, parser=HTML_PARSER)
+    except lxml.etree.ParserError:
+        return None
+
+
 def get_headers():
     """Return headers that mimic a real browser."""
     return {
@@ -165,6 +185,33 @@ def get_headers():
     }
 
 
+def _new_session() -> requests.Session:
+    """A keep-alive session for Redfin requests, retrying throttled/transient errors."""
+    session = requests.Session()
+    session.headers.update(get_headers())
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504]),
+    ))
+    return session
+
+
+def reset_session():
+    """Replace SESSION with a new one (no connections shared with the old)."""
+    global SESSION
+    SESSION = _new_session()
+
+
+# One session for all Redfin requests (a single host). A forked child (e.g. a
+# daily_pipeline worker) would otherwise share the parent's kept-alive sockets,
+# so it starts with a fresh session
+SESSION = _new_session()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_session)
+
+
 def format_price(price: int) -> str:
     """Format price for Redfin URL (e.g., 1500000 -> 1.5M)."""
     if price >= 1_000_000:
@@ -209,18 +256,18 @@ def fetch_redfin_search(zipcode: str, min_price: int = 1_500_000, max_price: int
         url = base_url if page == 1 else f"{base_url}/page-{page}"
         
         try:
-            resp = requests.get(url, headers=get_headers(), timeout=30)
+            resp = SESSION.get(url, timeout=30)
             resp.raise_for_status()
         except requests.RequestException as e:
             print(f"    Error fetching search page {page}: {e}", file=sys.stderr)
             break
         
-        soup = BeautifulSoup(resp.text, "html.parser")
+        tree = parse_html(resp.content)
+        hrefs = tree.xpath("//a/@href") if tree is not None else []
         page_urls = []
         
         # Find all property links
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
+        for href in hrefs:
             # Redfin property URLs contain /home/ followed by a property ID
             if re.search(r'/home/\d+', href) and href.startswith('/'):
                 full_url = f"https://www.redfin.com{href}"
@@ -250,21 +297,24 @@ def fetch_redfin_search(zipcode: str, min_price: int = 1_500_000, max_price: int
 def fetch_listing_details(url: str) -> Optional[ListingRecord]:
     """Fetch a single listing page and extract all details."""
     try:
-        resp = requests.get(url, headers=get_headers(), timeout=30)
+        resp = SESSION.get(url, timeout=30)
         resp.raise_for_status()
     except requests.RequestException as e:
         print(f"    Error fetching {url}: {e}", file=sys.stderr)
         return None
     
-    soup = BeautifulSoup(resp.text, "html.parser")
-    page_text = soup.get_text(" ", strip=True)
+    tree = parse_html(resp.content)
+    if tree is None:
+        print(f"    Empty page: {url}", file=sys.stderr)
+        return None
+    page_text = " ".join(s for s in (t.strip() for t in PAGE_TEXT(tree)) if s)
     
     record = ListingRecord(redfin_url=url)
     
     # Extract address from title
-    title = soup.find("title")
-    if title:
-        title_text = title.get_text()
+    title = tree.find(".//title")
+    if title is not None:
+        title_text = title.text_content()
         # Format: "123 Main St, La Jolla, CA 92037 | Redfin"
         addr_match = re.match(r'^(.+?)\s*\|', title_text)
         if addr_match: